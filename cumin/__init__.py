@@ -1,16 +1,19 @@
 """Automation and orchestration framework written in Python."""
 import logging
 import os
+import stat
 import subprocess
+import threading
+import time
 
 from importlib.metadata import PackageNotFoundError, version
 
-import yaml
-
-from ClusterShell.NodeSet import NodeSet, RESOLVER_NOGROUP
-
 
 KERBEROS_KLIST = '/usr/bin/klist'
+_CONFIG_CACHE = {}  # Keep track of the different loaded configurations by path, with the state of their files
+_CONFIG_CACHE_LOCK = threading.Lock()
+_KERBEROS_TICKET_CACHE = {'checked_at': 0.0, 'valid': False}  # Result of the last Kerberos ticket check
+_YAML_LOADER = None  # The YAML loader class to use, selected on the first configuration parsing
 try:
     __version__ = version(__name__)
     """:py:class:`str`: the version of the current Cumin module."""
@@ -31,15 +34,6 @@ LOGGING_TRACE_LEVEL_NUMBER = 8
 LOGGING_TRACE_LEVEL_NAME = 'TRACE'
 
 
-# Fail if the custom logging slot is already in use with a different name or
-# Access to a private property of logging was preferred over matching the default string returned by
-# logging.getLevelName() for unused custom slots.
-if (LOGGING_TRACE_LEVEL_NUMBER in logging._levelToName  # pylint: disable=protected-access
-        and LOGGING_TRACE_LEVEL_NAME not in logging._nameToLevel):  # pylint: disable=protected-access
-    raise CuminError("Unable to set custom logging for trace, logging level {level} is alredy set for '{name}'.".format(
-        level=LOGGING_TRACE_LEVEL_NUMBER, name=logging.getLevelName(LOGGING_TRACE_LEVEL_NUMBER)))
-
-
 def trace(self, msg, *args, **kwargs):
     """Additional logging level for development debugging.
 
@@ -51,49 +45,117 @@ def trace(self, msg, *args, **kwargs):
         self._log(LOGGING_TRACE_LEVEL_NUMBER, msg, args, **kwargs)  # pragma: no cover, pylint: disable=protected-access
 
 
-# Install the trace method and it's logging level if not already present
-if LOGGING_TRACE_LEVEL_NAME not in logging._nameToLevel:  # pylint: disable=protected-access
-    logging.addLevelName(LOGGING_TRACE_LEVEL_NUMBER, LOGGING_TRACE_LEVEL_NAME)
-if not hasattr(logging.Logger, 'trace'):
-    logging.Logger.trace = trace  # type: ignore
+# Probe the logging internals only if the trace method and its logging level are not both already installed,
+# like when the module is imported again.
+if (not hasattr(logging.Logger, 'trace')
+        or LOGGING_TRACE_LEVEL_NAME not in logging._nameToLevel):  # pylint: disable=protected-access
+    # Fail if the custom logging slot is already in use with a different name or
+    # Access to a private property of logging was preferred over matching the default string returned by
+    # logging.getLevelName() for unused custom slots.
+    if (LOGGING_TRACE_LEVEL_NUMBER in logging._levelToName  # pylint: disable=protected-access
+            and LOGGING_TRACE_LEVEL_NAME not in logging._nameToLevel):  # pylint: disable=protected-access
+        raise CuminError(f'Unable to set custom logging for trace, logging level {LOGGING_TRACE_LEVEL_NUMBER} is '
+                         f"alredy set for '{logging.getLevelName(LOGGING_TRACE_LEVEL_NUMBER)}'.")
+
+    # Install the trace method and it's logging level if not already present
+    if LOGGING_TRACE_LEVEL_NAME not in logging._nameToLevel:  # pylint: disable=protected-access
+        logging.addLevelName(LOGGING_TRACE_LEVEL_NUMBER, LOGGING_TRACE_LEVEL_NAME)
+    if not hasattr(logging.Logger, 'trace'):
+        logging.Logger.trace = trace  # type: ignore
 ##############################################################################
 
 
-class Config(dict):
-    """Singleton-like dictionary class to load the configuration from a given path only once."""
+def get_config(config='/etc/cumin/config.yaml'):
+    """Load the given configuration if not already loaded and return it.
+
+    The loaded configurations are cached by path, together with the inode and modification time of the configuration
+    and aliases files, so that a configuration is loaded again if any of its files was modified, replacing the cached
+    one.
+
+    Arguments:
+        config (str, optional): path to the configuration file to load, ``~`` is expanded to the user's home.
+
+    Returns:
+        dict: the configuration dictionary.
+
+    Examples:
+        >>> import cumin
+        >>> config = cumin.get_config()
+
+    """
+    config = os.path.abspath(os.path.expanduser(config))  # Equivalent paths share the same cached configuration
+    aliases_file = _get_aliases_path(config)
+    files_state = (_get_file_state(config), _get_file_state(aliases_file))
+
+    with _CONFIG_CACHE_LOCK:
+        cached = _CONFIG_CACHE.get(config)
+        if cached is None or cached[0] != files_state:
+            loaded = parse_config(config)  # Let it report the error if the file is missing or not readable
+            if files_state[1] is not None:  # Load the aliases only if present
+                loaded['aliases'] = parse_config(aliases_file)
+
+            cached = (files_state, loaded)
+            _CONFIG_CACHE[config] = cached
+
+        return cached[1]
+
+
+Config = get_config
+"""Alias of :py:func:`cumin.get_config` kept for backward compatibility, ``cumin.Config()`` returns the configuration
+dictionary."""
+
+
+def clear_config_cache():
+    """Forget all the already loaded configurations, they will be loaded again by :py:func:`cumin.get_config`."""
+    with _CONFIG_CACHE_LOCK:
+        _CONFIG_CACHE.clear()
+
 
-    _instances = {}  # Keep track of different loaded configurations
+def _get_file_state(path):
+    """Return the inode and modification time of the given file, to detect if it was replaced or modified.
+
+    Arguments:
+        path (str): the path of the file.
+
+    Returns:
+        tuple: with the inode and the modification time in nanoseconds of the file, :py:data:`None` if the path doesn't
+        exist or is not a regular file.
+
+    """
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
 
-    def __new__(cls, config='/etc/cumin/config.yaml'):
-        """Load the given configuration if not already loaded and return it.
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
 
-        Called by Python's data model for each new instantiation of the class.
+    return file_stat.st_ino, file_stat.st_mtime_ns
 
-        Arguments:
-            config (str, optional): path to the configuration file to load.
 
-        Returns:
-            dict: the configuration dictionary.
+def _get_aliases_path(config_file):
+    """Return the path of the aliases file that lives alongside the given configuration file.
 
-        Examples:
-            >>> import cumin
-            >>> config = cumin.Config()
+    Arguments:
+        config_file (str): the path of the configuration file.
 
-        """
-        if config not in cls._instances:
-            cls._instances[config] = parse_config(config)
-            alias_file = os.path.join(os.path.dirname(config), 'aliases.yaml')
-            if os.path.isfile(alias_file):  # Load the aliases only if present
-                cls._instances[config]['aliases'] = parse_config(alias_file)
+    Returns:
+        str: the path of the aliases file.
 
-        return cls._instances[config]
+    """
+    head, sep, _ = config_file.rpartition('/')
+    return head + sep + 'aliases.yaml'
 
 
 def parse_config(config_file):
     """Parse the YAML configuration file.
 
+    The file can contain multiple YAML documents, each one a mapping. They are parsed one at a time and merged together
+    in order, hence keys in later documents override the same keys in earlier ones.
+
     Arguments:
-        config_file (str): the path of the configuration file to load.
+        config_file (str): the path of the configuration file to load. It is used as is, ``~`` is not expanded, the
+            callers are expected to pass an already resolved path, see :py:func:`cumin.get_config`.
 
     Returns:
         dict: the configuration dictionary.
@@ -102,14 +164,30 @@ def parse_config(config_file):
         CuminError: if unable to read or parse the configuration.
 
     """
+    # Imported here to not pay its import cost when the configuration is not needed
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    global _YAML_LOADER  # pylint: disable=global-statement
+    if _YAML_LOADER is None:  # Prefer the libyaml bindings, fallback to the pure Python loader if not available
+        _YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
     try:
-        with open(os.path.expanduser(config_file), 'r', encoding='utf8') as f:
-            config = yaml.safe_load(f)
+        with open(config_file, 'rb') as f:  # Let the YAML parser detect the encoding
+            documents = yaml.load_all(f, Loader=_YAML_LOADER)  # nosec - it's a safe loader
+            config = next(documents, None)
+            for document in documents:  # Stream any additional document, discarding each one once merged
+                if config is None:
+                    config = {}
+                if not document:
+                    continue
+                if not isinstance(config, dict) or not isinstance(document, dict):
+                    raise CuminError(f"Unable to parse configuration file '{config_file}': multiple documents "
+                                     'must be all mappings')
+                config.update(document)
     except IOError as e:
-        raise CuminError('Unable to read configuration file: {message}'.format(message=e)) from e
-    except yaml.parser.ParserError as e:
-        raise CuminError("Unable to parse configuration file '{config}':\n{message}".format(
-            config=config_file, message=e)) from e
+        raise CuminError(f'Unable to read configuration file: {e}') from e
+    except yaml.YAMLError as e:  # Base class for all the parser, scanner and reader errors
+        raise CuminError(f"Unable to parse configuration file '{config_file}':\n{e}") from e
 
     if config is None:
         config = {}
@@ -129,13 +207,16 @@ def nodeset(nodes=None):
         https://github.com/cea-hpc/clustershell/issues/368
 
     """
+    # Imported here to not pay the ClusterShell import cost when no NodeSet is needed
+    from ClusterShell.NodeSet import NodeSet, RESOLVER_NOGROUP  # pylint: disable=import-outside-toplevel
+
     return NodeSet(nodes=nodes, resolver=RESOLVER_NOGROUP)
 
 
 def nodeset_fromlist(nodelist):
     """Instantiate a ClusterShell NodeSet from a list with the resolver defaulting to :py:const:`RESOLVER_NOGROUP`.
 
-    This allow to avoid any conflict with Cumin grammars.
+    This allow to avoid any conflict with Cumin grammars. Any iterable can be passed, its nodes are added one at a time.
 
     Returns:
         ClusterShell.NodeSet.NodeSet: the instantiated NodeSet.
@@ -144,14 +225,23 @@ def nodeset_fromlist(nodelist):
         https://github.com/cea-hpc/clustershell/issues/368
 
     """
+    # Imported here to not pay the ClusterShell import cost when no NodeSet is needed
+    from ClusterShell.NodeSet import NodeSet, RESOLVER_NOGROUP  # pylint: disable=import-outside-toplevel
+
     return NodeSet.fromlist(nodelist, resolver=RESOLVER_NOGROUP)
 
 
-def ensure_kerberos_ticket(config: Config) -> None:
+def ensure_kerberos_ticket(config: dict) -> None:
     """Ensure that there is a valid Kerberos ticket for the current user, according to the given configuration.
 
+    If the ``kerberos.cache_ttl`` configuration is set to a positive number of seconds, a successful check is trusted
+    for that amount of time, avoiding to execute ``klist`` at each call.
+
+    If the ``kerberos.ccache_max_age`` configuration is set to a positive number of seconds, a file-based credential
+    cache modified less than that amount of time ago is considered valid without executing ``klist``.
+
     Arguments:
-        config (cumin.Config): the Cumin's configuration dictionary.
+        config (dict): the Cumin's configuration dictionary.
 
     """
     kerberos_config = config.get('kerberos', {})
@@ -161,12 +251,52 @@ def ensure_kerberos_ticket(config: Config) -> None:
     if not kerberos_config.get('ensure_ticket_root', False) and os.geteuid() == 0:
         return
 
+    cache_ttl = kerberos_config.get('cache_ttl', 0)
+    if (cache_ttl > 0 and _KERBEROS_TICKET_CACHE['valid']
+            and time.monotonic() - _KERBEROS_TICKET_CACHE['checked_at'] < cache_ttl):
+        return
+
+    ccache_max_age = kerberos_config.get('ccache_max_age', 0)
+    if ccache_max_age > 0 and _kerberos_ccache_appears_valid(ccache_max_age):
+        return
+
     if not os.access(KERBEROS_KLIST, os.X_OK):
-        raise CuminError('The Kerberos config ensure_ticket is set to true, but {klist} executable was '
-                         'not found.'.format(klist=KERBEROS_KLIST))
+        raise CuminError(f'The Kerberos config ensure_ticket is set to true, but {KERBEROS_KLIST} executable was '
+                         'not found.')
 
+    _KERBEROS_TICKET_CACHE['valid'] = False
     try:
         subprocess.run([KERBEROS_KLIST, '-s'], check=True)  # nosec
     except subprocess.CalledProcessError as e:
         raise CuminError('The Kerberos config ensure_ticket is set to true, but no active Kerberos ticket was found, '
                          "please run 'kinit' and retry.") from e
+
+    _KERBEROS_TICKET_CACHE['valid'] = True
+    _KERBEROS_TICKET_CACHE['checked_at'] = time.monotonic()
+
+
+def _kerberos_ccache_appears_valid(max_age):
+    """Check if the Kerberos credential cache of the current user appears to be valid, without executing ``klist``.
+
+    Only file-based credential caches are checked, the cache is considered valid if it was modified less than the
+    given amount of seconds ago.
+
+    Arguments:
+        max_age (int): the maximum age in seconds of the credential cache file to be considered valid.
+
+    Returns:
+        bool: :py:data:`True` if the credential cache appears to be valid, :py:data:`False` otherwise.
+
+    """
+    ccache = os.environ.get('KRB5CCNAME', f'/tmp/krb5cc_{os.geteuid()}')  # nosec - default path used by Kerberos
+    if ccache.startswith('FILE:'):
+        ccache = ccache[5:]
+    elif ':' in ccache:  # Other types of credential caches (KEYRING, KCM, ...) can't be checked
+        return False
+
+    try:
+        mtime = os.stat(ccache).st_mtime
+    except OSError:
+        return False
+
+    return time.time() - mtime < max_age
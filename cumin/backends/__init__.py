@@ -1,28 +1,151 @@
 """Abstract backend."""
 
+import functools
 import logging
+import re
 
 from abc import ABCMeta, abstractmethod
 
 import pyparsing
 
-from cumin import CuminError, nodeset
+from cumin import CuminError, LOGGING_TRACE_LEVEL_NUMBER, nodeset
+
+
+BOOLEAN_OPERATORS = ('and not', 'and', 'xor', 'or')
+""":py:class:`tuple`: the boolean operators allowed in the grammars, in the order in which they are matched."""
+
+# The boolean operators, matched as caseless keywords: not preceded nor followed by other keyword characters
+_BOOLEAN_PATTERN = re.compile(rf"(?<![A-Za-z0-9_$])(?:{'|'.join(BOOLEAN_OPERATORS)})(?![A-Za-z0-9_$])",
+                              re.ASCII | re.IGNORECASE)
+_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
 
 
 class InvalidQueryError(CuminError):
     """Custom exception class for invalid queries."""
 
 
+class LazyGrammar:
+    """Descriptor to set the grammar of a query class, building it only when accessed for the first time.
+
+    The grammar is then cached and shared by all the instances of the class, like when building it at import time.
+    This avoids to build the grammar of the backends that are imported but not used.
+
+    Examples:
+        >>> class MyQuery(BaseQuery):
+        ...     grammar = LazyGrammar(grammar)
+
+    """
+
+    __slots__ = ('factory', 'grammar')
+
+    def __init__(self, factory):
+        """Lazy grammar constructor.
+
+        Arguments:
+            factory (callable): the function without arguments that returns the grammar.
+
+        """
+        self.factory = factory
+        self.grammar = None
+
+    def __get__(self, instance, owner=None):
+        """Return the grammar, building it on the first access.
+
+        Arguments:
+            instance (cumin.backends.BaseQuery, None): the instance the grammar is accessed from, if any.
+            owner (type, optional): the class the grammar is accessed from.
+
+        Returns:
+            pyparsing.ParserElement: the grammar parser.
+
+        """
+        if self.grammar is None:
+            self.grammar = self.factory()
+
+        return self.grammar
+
+
+class StackElement:
+    """A stack element of :py:class:`cumin.backends.BaseQueryAggregator`, either some hosts or a subgroup.
+
+    For backward compatibility with the derived classes the attributes can be accessed also as dictionary keys:
+    ``element['hosts']`` is equivalent to ``element.hosts``.
+    """
+
+    __slots__ = ('hosts', 'children', 'bool')
+
+    def __init__(self):
+        """Stack element constructor, initialize an empty element."""
+        self.hosts = None  # The NodeSet of the hosts, None for subgroups
+        self.children = []  # The child stack elements of a subgroup
+        self.bool = None  # The boolean operator that precedes the element, None for the first one
+
+    def __getitem__(self, key):
+        """Get an attribute as a dictionary key, for backward compatibility.
+
+        Arguments:
+            key (str): the name of the attribute.
+
+        Returns:
+            mixed: the value of the attribute.
+
+        Raises:
+            KeyError: if there is no attribute with the given name.
+
+        """
+        try:
+            return getattr(self, key)
+        except AttributeError as e:
+            raise KeyError(key) from e
+
+    def __setitem__(self, key, value):
+        """Set an attribute as a dictionary key, for backward compatibility.
+
+        Arguments:
+            key (str): the name of the attribute.
+            value (mixed): the value to set.
+
+        Raises:
+            KeyError: if there is no attribute with the given name.
+
+        """
+        try:
+            setattr(self, key, value)
+        except AttributeError as e:
+            raise KeyError(key) from e
+
+    def __repr__(self):
+        """Return the representation of the element, for debugging purposes.
+
+        Returns:
+            str: the representation of the object.
+
+        """
+        return f'StackElement(hosts={self.hosts!r}, bool={self.bool!r}, children={self.children!r})'
+
+
 class BaseQuery(metaclass=ABCMeta):
     """Query abstract class.
 
     All backends query classes must inherit, directly or indirectly, from this one.
     """
 
+    __slots__ = ('config', 'logger')  # Avoid a per-instance __dict__, derived classes should define their own
+
     grammar = pyparsing.NoMatch()  # This grammar will never match.
     """:py:class:`pyparsing.ParserElement`: derived classes must define their own pyparsing grammar and set this class
     attribute accordingly."""
 
+    def __init_subclass__(cls, **kwargs):
+        """Set the logger of each derived class, shared by all its instances.
+
+        :Parameters:
+            according to :py:meth:`object.__init_subclass__`.
+
+        """
+        super().__init_subclass__(**kwargs)
+        cls._logger = logging.getLogger('.'.join((cls.__module__, cls.__name__)))
+
     def __init__(self, config):
         """Query constructor.
 
@@ -31,7 +154,7 @@ class BaseQuery(metaclass=ABCMeta):
 
         """
         self.config = config
-        self.logger = logging.getLogger('.'.join((self.__module__, self.__class__.__name__)))
+        self.logger = self._logger
         self.logger.trace('Backend %s created with config: %s', type(self).__name__, config)
 
     def execute(self, query_string):
@@ -89,6 +212,8 @@ class BaseQueryAggregator(BaseQuery):
     operators.
     """
 
+    __slots__ = ('stack', 'stack_pointer', 'stack_parents')
+
     def __init__(self, config):
         """Query aggregator constructor, initialize the stack.
 
@@ -99,6 +224,7 @@ class BaseQueryAggregator(BaseQuery):
 
         self.stack = None
         self.stack_pointer = None
+        self.stack_parents = []  # The currently open subgroups, the stack elements don't point back to their parent
 
     def _build(self, query_string):
         """Override parent method to reset the stack and log it.
@@ -108,7 +234,9 @@ class BaseQueryAggregator(BaseQuery):
         """
         self.stack = self._get_stack_element()
         self.stack_pointer = self.stack
+        self.stack_parents = []
         super()._build(query_string)
+        self._flatten_stack()
         self.logger.trace('Query stack: %s', self.stack)
 
     def _execute(self):
@@ -126,13 +254,40 @@ class BaseQueryAggregator(BaseQuery):
     def _open_subgroup(self):
         """Handle subgroup opening."""
         element = self._get_stack_element()
-        element['parent'] = self.stack_pointer
-        self.stack_pointer['children'].append(element)
+        self.stack_parents.append(self.stack_pointer)
+        self.stack_pointer.children.append(element)
         self.stack_pointer = element
 
     def _close_subgroup(self):
         """Handle subgroup closing."""
-        self.stack_pointer = self.stack_pointer['parent']
+        self.stack_pointer = self.stack_parents.pop()
+
+    def _add_hosts(self, hosts, bool_operator):
+        """Add a stack element with the given hosts to the current subgroup.
+
+        Arguments:
+            hosts (mixed): the hosts, usually a string in ClusterShell syntax to be expanded by the caller.
+            bool_operator (str, None): the boolean operator that precedes the hosts, if any.
+
+        Returns:
+            cumin.backends.StackElement: the added stack element.
+
+        """
+        element = self._get_stack_element()
+        element.hosts = hosts
+        element.bool = bool_operator
+        self.stack_pointer.children.append(element)
+        return element
+
+    def _open_bool_subgroup(self, bool_operator):
+        """Open a subgroup preceded by the given boolean operator.
+
+        Arguments:
+            bool_operator (str, None): the boolean operator that precedes the subgroup, if any.
+
+        """
+        self._open_subgroup()
+        self.stack_pointer.bool = bool_operator
 
     @abstractmethod
     def _parse_token(self, token):
@@ -147,10 +302,26 @@ class BaseQueryAggregator(BaseQuery):
         """Return an empty stack element.
 
         Returns:
-            dict: the dictionary with an empty stack element.
+            cumin.backends.StackElement: the empty stack element.
+
+        """
+        return StackElement()
+
+    def _flatten_stack(self):
+        """Collapse in place the subgroups of the stack that have a single child, like ``(host1)``.
 
+        The child is spliced into the subgroup, that keeps its own boolean operator, as the result of the subgroup is
+        the result of its only child. This avoids to aggregate the results of the child into the subgroup on execution.
         """
-        return {'hosts': None, 'children': [], 'parent': None, 'bool': None}
+        elements = [self.stack]
+        while elements:
+            element = elements.pop()
+            while len(element.children) == 1:
+                child = element.children[0]
+                element.hosts = child.hosts
+                element.children = child.children
+
+            elements.extend(element.children)
 
     def _loop_stack(self, hosts, stack_element):
         """Loop the stack generated while parsing the query and aggregate the results.
@@ -158,17 +329,41 @@ class BaseQueryAggregator(BaseQuery):
         Arguments:
             hosts (ClusterShell.NodeSet.NodeSet): the hosts to be updated with the current stack element results. This
                 object is updated in place by reference.
-            stack_element (dict): the stack element to iterate.
+            stack_element (cumin.backends.StackElement): the stack element to iterate.
 
         """
-        if stack_element['hosts'] is None:
-            element_hosts = nodeset()
-            for child in stack_element['children']:
-                self._loop_stack(element_hosts, child)
-        else:
-            element_hosts = stack_element['hosts']
-
-        self._aggregate_hosts(hosts, element_hosts, stack_element['bool'])
+        # Post-order traversal with an explicit stack instead of recursion. Each frame holds a stack element, the frame
+        # of its parent subgroup and, for subgroups, the hosts aggregated so far and the iterator on its children.
+        frames = [[stack_element, None, None, None]]
+        while frames:
+            frame = frames[-1]
+            element = frame[0]
+            if element.hosts is not None:
+                frames.pop()
+                element_hosts = element.hosts
+                owned = False  # The stack might be reused, its hosts must not be modified
+            else:
+                if frame[3] is None:  # First visit of a subgroup
+                    frame[3] = iter(element.children)
+
+                child = next(frame[3], None)
+                if child is not None:
+                    frames.append([child, frame, None, None])
+                    continue
+
+                frames.pop()  # All children have been aggregated
+                element_hosts = frame[2] if frame[2] is not None else nodeset()
+                owned = True
+
+            parent = frame[1]
+            if parent is None:
+                self._aggregate_hosts(hosts, element_hosts, element.bool)
+            elif parent[2] is None and element.bool is None:  # First hosts, no need to add them to a new NodeSet
+                parent[2] = element_hosts if owned else element_hosts.copy()
+            else:
+                if parent[2] is None:  # pragma: no cover - this should never happen, let _aggregate_hosts() raise
+                    parent[2] = nodeset()
+                self._aggregate_hosts(parent[2], element_hosts, element.bool)
 
     def _aggregate_hosts(self, hosts, element_hosts, bool_operator):
         """Aggregate hosts according to their boolean operator.
@@ -182,13 +377,21 @@ class BaseQueryAggregator(BaseQuery):
                 :py:data:`None` when adding the first hosts.
 
         """
-        self.logger.trace("Aggregating: %s | %s | %s", hosts, bool_operator, element_hosts)
+        if self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER):  # Called for each stack element, skip it if not needed
+            self.logger.trace("Aggregating: %s | %s | %s", hosts, bool_operator, element_hosts)
 
         # This should never happen
         if (bool_operator is None and hosts) or (bool_operator is not None and not hosts):  # pragma: no cover
             raise InvalidQueryError("Unexpected boolean operator '{boolean}' with hosts '{hosts}'".format(
                 boolean=bool_operator, hosts=hosts))
 
+        if not element_hosts:  # Skip the NodeSet operations, the result is already known
+            if bool_operator == 'and':
+                hosts.clear()
+                return
+            if bool_operator in (None, 'or', 'and not', 'xor'):
+                return
+
         if bool_operator is None or bool_operator == 'or':
             hosts |= element_hosts
         elif bool_operator == 'and':
@@ -200,3 +403,140 @@ class BaseQueryAggregator(BaseQuery):
         else:  # pragma: no cover - this should never happen
             raise InvalidQueryError("Invalid bool operator '{boolean}' found, one of and|and not|or expected".format(
                 boolean=bool_operator))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_hosts_pattern(hosts_chars):
+    """Return the compiled regular expression that matches a sequence of the given hosts characters.
+
+    Arguments:
+        hosts_chars (frozenset): the characters allowed in the hosts.
+
+    Returns:
+        re.Pattern: the compiled regular expression.
+
+    """
+    chars = ''.join(re.escape(char) for char in sorted(hosts_chars))
+    return re.compile(f'[{chars}]+')
+
+
+class BooleanQueryParser:
+    """Hand-written recursive-descent parser for queries of hosts combined with boolean operators and subgroups.
+
+    It accepts the same language of the pyparsing grammars of the backends that select hosts directly, like
+    :py:func:`cumin.backends.direct.grammar`, that differ only in the characters allowed in the hosts. It doesn't
+    generate any intermediate parse result, it calls the given callbacks while parsing the query instead.
+
+    Backus-Naur form (BNF) of the grammar::
+
+        <grammar> ::= <item> | <item> <boolean> <grammar>
+           <item> ::= <hosts> | "(" <grammar> ")"
+        <boolean> ::= "and not" | "and" | "xor" | "or"
+
+    """
+
+    __slots__ = ('text', 'pos', 'hosts_chars', 'on_hosts', 'on_open', 'on_close')
+
+    def __init__(self, text, hosts_chars, on_hosts, on_open, on_close):  # pylint: disable=too-many-arguments
+        """Parser constructor.
+
+        Arguments:
+            text (str): the query string to parse.
+            hosts_chars (frozenset): the characters allowed in the hosts.
+            on_hosts (callable): called with the hosts string and the preceding boolean operator, or :py:data:`None`,
+                for each hosts item.
+            on_open (callable): called with the preceding boolean operator, or :py:data:`None`, when a subgroup is
+                opened.
+            on_close (callable): called without arguments when a subgroup is closed.
+
+        """
+        self.text = text
+        self.pos = 0
+        self.hosts_chars = hosts_chars
+        self.on_hosts = on_hosts
+        self.on_open = on_open
+        self.on_close = on_close
+
+    def parse(self):
+        """Parse the whole query string.
+
+        Raises:
+            pyparsing.ParseException: if the query string is not valid, for consistency with the other backends.
+
+        """
+        self._parse_grammar()
+        self._skip_whitespace()
+        if self.pos != len(self.text):
+            self._fail('Expected end of text')
+
+    def _parse_grammar(self):
+        """Parse a ``<grammar>``: an item followed by any number of boolean operator and item pairs."""
+        self._parse_item(None)
+        while True:
+            self._skip_whitespace()
+            bool_operator = self._match_boolean()
+            if bool_operator is None:
+                return
+
+            self.pos += len(bool_operator)
+            self._parse_item(bool_operator)
+
+    def _parse_item(self, bool_operator):
+        """Parse an ``<item>``: either the hosts or a subgroup enclosed in parentheses.
+
+        Arguments:
+            bool_operator (str, None): the boolean operator that precedes the item, if any.
+
+        """
+        self._skip_whitespace()
+        text = self.text
+        start = self.pos
+        if self._match_boolean() is None:  # Boolean operators are not valid hosts
+            match = _get_hosts_pattern(self.hosts_chars).match(text, start)
+            if match is not None:
+                self.pos = match.end()
+                self.on_hosts(match.group(), bool_operator)
+                return
+
+        if start < len(text) and text[start] == '(':
+            self.pos += 1
+            self.on_open(bool_operator)
+            self._parse_grammar()
+            self._skip_whitespace()
+            if self.pos >= len(text) or text[self.pos] != ')':
+                self._fail("Expected ')'")
+
+            self.pos += 1
+            self.on_close()
+            return
+
+        self._fail("Expected hosts or '('")
+
+    def _match_boolean(self):
+        """Return the boolean operator at the current position, if any, matched as a caseless keyword.
+
+        Returns:
+            str, None: the matched boolean operator or :py:data:`None` if there is no match.
+
+        """
+        match = _BOOLEAN_PATTERN.match(self.text, self.pos)
+        if match is None:
+            return None
+
+        return match.group().lower()
+
+    def _skip_whitespace(self):
+        """Move the current position after any whitespace."""
+        self.pos = _WHITESPACE_PATTERN.match(self.text, self.pos).end()
+
+    def _fail(self, message):
+        """Raise a parsing exception at the current position.
+
+        Arguments:
+            message (str): the error message.
+
+        Raises:
+            pyparsing.ParseException: always.
+
+        """
+        raise pyparsing.ParseException(self.text, self.pos, message)
@@ -1,8 +1,27 @@
 """Direct backend."""
+import functools
+import re
+import string
+import threading
+
+from collections import OrderedDict
+
 import pyparsing as pp
 
-from cumin import nodeset_fromlist
-from cumin.backends import BaseQueryAggregator, InvalidQueryError
+from cumin import LOGGING_TRACE_LEVEL_NUMBER, nodeset_fromlist
+from cumin.backends import BaseQueryAggregator, BooleanQueryParser, InvalidQueryError, LazyGrammar
+
+
+STACK_CACHE_SIZE = 128
+""":py:class:`int`: the maximum number of built query stacks to keep cached, the least recently used are discarded."""
+
+HOSTS_CACHE_SIZE = 1024
+""":py:class:`int`: the maximum number of expanded hosts strings to keep cached, the least recently used are dropped."""
+
+_HOSTS_CHARS = frozenset(string.ascii_letters + string.digits + '-_.,!&^[]')
+_HOSTS_REGEX = r'[A-Za-z0-9\-_.,!&^\[\]]+'  # Same characters of _HOSTS_CHARS
+# A query made only of a single hosts item: no whitespace nor parentheses and not starting with a boolean operator
+_SINGLE_HOSTS_PATTERN = re.compile(r'(?!(?:and|xor|or)(?![A-Za-z0-9_$]))' + _HOSTS_REGEX, re.ASCII | re.IGNORECASE)
 
 
 def grammar():
@@ -30,7 +49,7 @@ def grammar():
     rpar = pp.Literal(')')('close_subgroup')
 
     # Hosts selection: clustershell (,!&^[]) syntax is allowed: host10[10-42].domain
-    hosts = (~(boolean) + pp.Word(pp.alphanums + '-_.,!&^[]'))('hosts')
+    hosts = (~(boolean) + pp.Regex(_HOSTS_REGEX))('hosts')
 
     # Final grammar, see the docstring for its BNF based on the tokens defined above
     # Groups are used to split the parsed results for an easy access
@@ -41,6 +60,37 @@ def grammar():
     return full_grammar
 
 
+@functools.lru_cache(maxsize=HOSTS_CACHE_SIZE)
+def _expand_hosts(hosts):
+    """Expand the given hosts string in ClusterShell syntax, caching the result.
+
+    Arguments:
+        hosts (str): the hosts string to expand.
+
+    Returns:
+        ClusterShell.NodeSet.NodeSet: the cached NodeSet, it must not be modified.
+
+    """
+    return nodeset_fromlist([hosts])
+
+
+def _get_hosts(hosts_list):
+    """Return a new NodeSet with the union of the given hosts strings, expanding each string only once.
+
+    Arguments:
+        hosts_list (list): the hosts strings in ClusterShell syntax.
+
+    Returns:
+        ClusterShell.NodeSet.NodeSet: the hosts, copying a cached NodeSet is much faster than expanding the string.
+
+    """
+    hosts = _expand_hosts(hosts_list[0]).copy()
+    for other_hosts in hosts_list[1:]:
+        hosts.update(_expand_hosts(other_hosts))
+
+    return hosts
+
+
 class DirectQuery(BaseQueryAggregator):
     """DirectQuery query builder.
 
@@ -59,8 +109,81 @@ class DirectQuery(BaseQueryAggregator):
       ``host100[1-5].domain or (host10[30-40].domain and (host10[10-42].domain and not host33.domain))``
     """
 
-    grammar = grammar()
-    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once in a singleton-like way."""
+    __slots__ = ()
+
+    _stack_cache = OrderedDict()  # LRU cache of the built stacks by query string, shared by all the instances
+    _stack_cache_lock = threading.Lock()
+
+    grammar = LazyGrammar(grammar)
+    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once, when first used, in a singleton-like way.
+    Kept for backward compatibility, the queries are parsed with a faster hand-written parser that accepts the same
+    language."""
+
+    def _build(self, query_string):
+        """Override parent method to parse the query string without pyparsing, building the stack while parsing.
+
+        :Parameters:
+            according to parent :py:meth:`cumin.backends.BaseQuery._build`.
+
+        Raises:
+            pyparsing.ParseException: if the query string is not valid.
+
+        """
+        query_string = query_string.strip()
+        with self._stack_cache_lock:
+            stack = self._stack_cache.get(query_string)
+            if stack is not None:
+                self._stack_cache.move_to_end(query_string)
+
+        if stack is not None:  # The stack is never modified during the execution, it can be safely reused
+            self.stack = stack
+            self.stack_pointer = stack
+            self.stack_parents = []
+            self.logger.trace('Query stack from cache: %s', self.stack)
+            return
+
+        self.stack = self._get_stack_element()
+        self.stack_pointer = self.stack
+        self.stack_parents = []
+        self.logger.trace('Parsing query: %s', query_string)
+        hosts_elements = []  # Hosts stack elements with the list of their hosts strings and their subgroup children
+
+        def add_hosts(hosts, bool_operator):
+            children = self.stack_pointer.children
+            # Fuse a chain of hosts in logical OR into a single stack element, that is always the last one added
+            if (bool_operator == 'or' and children and children[-1].hosts is not None
+                    and children[-1].bool in (None, 'or')):
+                hosts_elements[-1][1].append(hosts)
+            else:
+                hosts_elements.append((self._add_hosts(hosts, bool_operator), [hosts], children))
+
+        if _SINGLE_HOSTS_PATTERN.fullmatch(query_string):  # The most common case, no need to parse it
+            add_hosts(query_string, None)
+        else:
+            BooleanQueryParser(query_string, _HOSTS_CHARS, add_hosts, self._open_bool_subgroup,
+                               self._close_subgroup).parse()
+
+        # Expand the hosts only once the whole query is known to be valid, like when parsing it with pyparsing
+        for element, hosts_list, children in hosts_elements:
+            element.hosts = _expand_hosts(hosts_list[0]).copy()
+            if element.bool is None and not element.hosts and len(hosts_list) > 1:
+                # A boolean operator after empty first hosts is invalid, unfuse the chain to let the aggregation fail
+                position = children.index(element) + 1
+                for hosts in reversed(hosts_list[1:]):
+                    children.insert(position, self._get_stack_element())
+                    children[position].hosts = _get_hosts([hosts])
+                    children[position].bool = 'or'
+                continue
+
+            for other_hosts in hosts_list[1:]:
+                element.hosts.update(_expand_hosts(other_hosts))
+
+        self._flatten_stack()
+        self.logger.trace('Query stack: %s', self.stack)
+        with self._stack_cache_lock:
+            self._stack_cache[query_string] = self.stack
+            if len(self._stack_cache) > STACK_CACHE_SIZE:
+                self._stack_cache.popitem(last=False)
 
     def _parse_token(self, token):
         """Concrete implementation of parent abstract method.
@@ -72,19 +195,17 @@ class DirectQuery(BaseQueryAggregator):
             raise InvalidQueryError('Expecting ParseResults object, got {type}: {token}'.format(
                 type=type(token), token=token))
 
-        token_dict = token.asDict()
-        self.logger.trace('Token is: %s | %s', token_dict, token)
+        if self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER):
+            self.logger.trace('Token is: %s', token)
 
-        if 'hosts' in token_dict:
+        if 'hosts' in token:
             element = self._get_stack_element()
-            element['hosts'] = nodeset_fromlist(token_dict['hosts'])
-            if 'bool' in token_dict:
-                element['bool'] = token_dict['bool']
-            self.stack_pointer['children'].append(element)
-        elif 'open_subgroup' in token_dict and 'close_subgroup' in token_dict:
+            element.hosts = _get_hosts(token['hosts'])
+            element.bool = token.get('bool')
+            self.stack_pointer.children.append(element)
+        elif 'open_subgroup' in token and 'close_subgroup' in token:
             self._open_subgroup()
-            if 'bool' in token_dict:
-                self.stack_pointer['bool'] = token_dict['bool']
+            self.stack_pointer.bool = token.get('bool')
             for subtoken in token:
                 if isinstance(subtoken, str):  # Grammar literals, boolean operators and parentheses
                     continue
@@ -1,12 +1,28 @@
 """Known hosts backend."""
-import ipaddress
+import os
+import re
+import socket
+import string
+import threading
 
 import pyparsing as pp
 
 from ClusterShell.NodeSet import NodeSet
 from ClusterShell.NodeUtils import GroupResolver, GroupSource
 
-from cumin.backends import BaseQueryAggregator, InvalidQueryError
+from cumin import LOGGING_TRACE_LEVEL_NUMBER
+from cumin.backends import BaseQueryAggregator, BooleanQueryParser, InvalidQueryError, LazyGrammar
+
+
+_HOSTS_CHARS = frozenset(string.ascii_letters + string.digits + '-_.,!&^[]*?')
+# A query made only of a single hosts item: no whitespace nor parentheses and not starting with a boolean operator
+_SINGLE_HOSTS_PATTERN = re.compile(r'(?!(?:and|xor|or)(?![A-Za-z0-9_$]))[A-Za-z0-9\-_.,!&^\[\]*?]+',
+                                   re.ASCII | re.IGNORECASE)
+_IP_CHARS = frozenset(string.hexdigits + ':.')  # The characters of IPv4 and IPv6 addresses, excluding the scope ID
+# A line with the hosts field and at least two more fields, without markers, not hashed nor a comment
+_HOSTS_LINE_PATTERN = re.compile(r'\s*([^\s#|@]\S*)\s+\S+\s+\S')
+_KNOWN_HOSTS_CACHE = {}  # The last loaded known hosts and resolver for each list of known hosts files
+_KNOWN_HOSTS_CACHE_LOCK = threading.Lock()
 
 
 def grammar():
@@ -52,6 +68,33 @@ def grammar():
     return full_grammar
 
 
+def _is_ip_address(address):
+    """Return whether the given string is a valid IPv4 or IPv6 address, optionally scoped for IPv6.
+
+    Accepts the same addresses of :py:func:`ipaddress.ip_address`, but is much faster as it relies on the C
+    implementation of :py:func:`socket.inet_pton` without instantiating any object.
+
+    Arguments:
+        address (str): the string to check.
+
+    Returns:
+        bool: :py:data:`True` if the string is a valid IP address, :py:data:`False` otherwise.
+
+    """
+    address, scope_separator, scope_id = address.partition('%')
+    if scope_separator and (':' not in address or not scope_id or '%' in scope_id):  # Scope ID only for IPv6
+        return False
+
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, address)
+            return True
+        except OSError:
+            continue
+
+    return False
+
+
 class KnownHostsLineError(InvalidQueryError):
     """Custom exception class for invalid lines in SSH known hosts files."""
 
@@ -73,8 +116,12 @@ class KnownHostsQuery(BaseQueryAggregator):
     as a fallback backend in case the primary backend is unavailable but the known hosts file(s) are still up to date.
     """
 
-    grammar = grammar()
-    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once in a singleton-like way."""
+    __slots__ = ('known_hosts', 'resolver')
+
+    grammar = LazyGrammar(grammar)
+    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once, when first used, in a singleton-like
+    way. Kept for backward compatibility, the queries are parsed with a faster hand-written parser that accepts the same
+    language."""
 
     def __init__(self, config):
         """Known hosts query constructor, initialize the known hosts.
@@ -84,23 +131,44 @@ class KnownHostsQuery(BaseQueryAggregator):
         """
         super().__init__(config)
 
-        self.known_hosts = set()
+        self.known_hosts = frozenset()
         self.resolver = None
 
     def _build(self, query_string):
-        """Override parent method to lazy-loading the known hosts if needed.
+        """Override parent method to lazy-loading the known hosts if needed and to parse the query without pyparsing.
 
         :Parameters:
             according to parent :py:meth:`cumin.backends.BaseQuery._build`.
-        """
-        if not self.known_hosts:
-            self._load_known_hosts()
 
+        Raises:
+            pyparsing.ParseException: if the query string is not valid.
+
+        """
         if self.resolver is None:
-            source = GroupSource('all', allgroups='\n'.join(self.known_hosts))
-            self.resolver = GroupResolver(default_source=source)
+            self._load_resolver()
 
-        super()._build(query_string)
+        query_string = query_string.strip()
+        self.stack = self._get_stack_element()
+        self.stack_pointer = self.stack
+        self.stack_parents = []
+        self.logger.trace('Parsing query: %s', query_string)
+        hosts_elements = []
+
+        def add_hosts(hosts, bool_operator):
+            hosts_elements.append(self._add_hosts(hosts, bool_operator))
+
+        if _SINGLE_HOSTS_PATTERN.fullmatch(query_string):  # The most common case, no need to parse it
+            add_hosts(query_string, None)
+        else:
+            BooleanQueryParser(query_string, _HOSTS_CHARS, add_hosts, self._open_bool_subgroup,
+                               self._close_subgroup).parse()
+
+        # Expand the hosts only once the whole query is known to be valid, like when parsing it with pyparsing
+        for element in hosts_elements:
+            element.hosts = NodeSet.fromlist([element.hosts], resolver=self.resolver)
+
+        self._flatten_stack()
+        self.logger.trace('Query stack: %s', self.stack)
 
     def _execute(self):
         """Override parent method to ensure to return only existing hosts.
@@ -109,7 +177,8 @@ class KnownHostsQuery(BaseQueryAggregator):
             according to parent :py:meth:`cumin.backends.BaseQuery._execute`.
         """
         hosts = super()._execute()
-        return hosts & NodeSet('*', resolver=self.resolver)
+        # Check each selected host instead of expanding all the known hosts to intersect them
+        return NodeSet.fromlist([host for host in hosts if host in self.known_hosts], resolver=self.resolver)
 
     def _parse_token(self, token):
         """Concrete implementation of parent abstract method.
@@ -121,19 +190,17 @@ class KnownHostsQuery(BaseQueryAggregator):
             raise InvalidQueryError('Expecting ParseResults object, got {type}: {token}'.format(
                 type=type(token), token=token))
 
-        token_dict = token.asDict()
-        self.logger.trace('Token is: %s | %s', token_dict, token)
+        if self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER):
+            self.logger.trace('Token is: %s', token)
 
-        if 'hosts' in token_dict:
+        if 'hosts' in token:
             element = self._get_stack_element()
-            element['hosts'] = NodeSet.fromlist(token_dict['hosts'], resolver=self.resolver)
-            if 'bool' in token_dict:
-                element['bool'] = token_dict['bool']
-            self.stack_pointer['children'].append(element)
-        elif 'open_subgroup' in token_dict and 'close_subgroup' in token_dict:
+            element.hosts = NodeSet.fromlist(token['hosts'], resolver=self.resolver)
+            element.bool = token.get('bool')
+            self.stack_pointer.children.append(element)
+        elif 'open_subgroup' in token and 'close_subgroup' in token:
             self._open_subgroup()
-            if 'bool' in token_dict:
-                self.stack_pointer['bool'] = token_dict['bool']
+            self.stack_pointer.bool = token.get('bool')
             for subtoken in token:
                 if isinstance(subtoken, str):  # Grammar literals, boolean operators and parentheses
                     continue
@@ -142,18 +209,55 @@ class KnownHostsQuery(BaseQueryAggregator):
         else:  # pragma: no cover - this should never happen
             raise InvalidQueryError('Got unexpected token: {token}'.format(token=token))
 
+    def _load_resolver(self):
+        """Set the known hosts and their resolver, reusing the ones already loaded if the files were not modified.
+
+        The loaded known hosts and resolver are shared by all the instances with the same known hosts files, as long as
+        the modification time and size of all the files are unchanged.
+        """
+        filenames = tuple(self.config.get('knownhosts', {}).get('files', []))
+        try:
+            signature = tuple((stat.st_mtime_ns, stat.st_size) for stat in (os.stat(name) for name in filenames))
+        except OSError:  # Let _load_known_hosts() report the error
+            signature = None
+
+        with _KNOWN_HOSTS_CACHE_LOCK:
+            cached = _KNOWN_HOSTS_CACHE.get(filenames)
+
+        if signature is not None and cached is not None and cached[0] == signature:
+            _, self.known_hosts, self.resolver = cached
+            return
+
+        if not self.known_hosts:
+            self._load_known_hosts()
+
+        source = GroupSource('all', allgroups='\n'.join(self.known_hosts))
+        self.resolver = GroupResolver(default_source=source)
+        if signature is not None:
+            with _KNOWN_HOSTS_CACHE_LOCK:
+                _KNOWN_HOSTS_CACHE[filenames] = (signature, self.known_hosts, self.resolver)
+
     def _load_known_hosts(self):
-        """Load all known hosts file listed in the configuration."""
+        """Load all known hosts file listed in the configuration.
+
+        The loaded known hosts are frozen, as they might be shared with other instances.
+        """
         config = self.config.get('knownhosts', {})
         known_hosts_filenames = config.get('files', [])
 
+        known_hosts = set()
+        trace = self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER)  # Checked once, there might be many skipped lines
         for filename in known_hosts_filenames:
             hosts = set()
             with open(filename, 'r', encoding='utf8') as known_hosts_file:
                 for lineno, line in enumerate(known_hosts_file, 1):
                     try:
-                        found, skipped = KnownHostsQuery.parse_known_hosts_line(line)
-                        if skipped:
+                        match = _HOSTS_LINE_PATTERN.match(line)
+                        if match is not None:  # The most common lines, get the hosts field without splitting all fields
+                            found, skipped = KnownHostsQuery.parse_line_hosts(match.group(1))
+                        else:
+                            found, skipped = KnownHostsQuery.parse_known_hosts_line(line)
+                        if skipped and trace:
                             self.logger.trace("Skipped patterns at line %d in known hosts file '%s': %s",
                                               lineno, filename, ', '.join(skipped))
                         hosts.update(found)
@@ -161,10 +265,14 @@ class KnownHostsQuery(BaseQueryAggregator):
                         self.logger.warning("Discarded invalid line %d (%s) in known hosts file '%s': %s",
                                             lineno, e, filename, line)
                     except KnownHostsSkippedLineError as e:
-                        self.logger.trace("Skipped %s line %d in known hosts file '%s': %s", e, lineno, filename, line)
+                        if trace:
+                            self.logger.trace("Skipped %s line %d in known hosts file '%s': %s",
+                                              e, lineno, filename, line)
 
             self.logger.debug("Loaded %d hosts from '%s'", len(hosts), filename)
-            self.known_hosts.update(hosts)
+            known_hosts.update(hosts)
+
+        self.known_hosts = frozenset(known_hosts)
 
     @staticmethod
     def parse_known_hosts_line(line):
@@ -233,16 +341,16 @@ class KnownHostsQuery(BaseQueryAggregator):
                 host = host[1:]
 
             if host[0] == '[':
-                host = host[1:].split(']')[0]
+                host = host[1:].partition(']')[0]
 
             if '*' in host or '?' in host:
                 skipped.add(host)
+            elif not _IP_CHARS.issuperset(host.partition('%')[0]):  # Can't be an IP address, no need to parse it
+                hosts.add(host)
+            elif _is_ip_address(host):  # Add hostnames, skip IP addresses
+                skipped.add(host)
             else:
-                try:
-                    ipaddress.ip_address(host)
-                    skipped.add(host)
-                except ValueError:
-                    hosts.add(host)  # Add hostnames, skip IP addresses
+                hosts.add(host)
 
         return hosts, skipped
 
@@ -1,4 +1,6 @@
 """OpenStack backend."""
+from concurrent.futures import ThreadPoolExecutor
+
 import pyparsing as pp
 
 from keystoneauth1 import session as keystone_session
@@ -6,8 +8,13 @@ from keystoneauth1.identity import v3 as keystone_identity
 from keystoneclient.v3 import client as keystone_client
 from novaclient import client as nova_client
 
-from cumin import nodeset, nodeset_fromlist
-from cumin.backends import BaseQuery, InvalidQueryError
+from cumin import LOGGING_TRACE_LEVEL_NUMBER, nodeset, nodeset_fromlist
+from cumin.backends import BaseQuery, InvalidQueryError, LazyGrammar
+
+
+_KEY_CHARS = pp.srange('[a-z0-9-_.]"')  # Lowercase key
+# All printable characters except the parentheses that are part of the global grammar
+_VALUE_CHARS = ''.join(c for c in pp.printables if c not in frozenset('(){}'))
 
 
 def grammar():
@@ -30,9 +37,8 @@ def grammar():
 
     # Key-value tokens: key:value
     # Lowercase key, all printable characters except the parentheses that are part of the global grammar for the value
-    key = pp.Word(pp.srange('[a-z0-9-_.]"'), min=2)('key')
-    all_but_par = ''.join([c for c in pp.printables if c not in ('(', ')', '{', '}')])
-    value = (quoted_string | pp.Word(all_but_par))('value')
+    key = pp.Word(_KEY_CHARS, min=2)('key')
+    value = (quoted_string | pp.Word(_VALUE_CHARS))('value')
     item = pp.Combine(key + ':' + value)
 
     # Final grammar, see the docstring for its BNF based on the tokens defined above
@@ -40,19 +46,29 @@ def grammar():
     return pp.Group(pp.Literal('*')('all')) | pp.OneOrMore(pp.Group(item))
 
 
-def _get_keystone_session(config, project=None):
+def _get_keystone_session(config, project=None, session=None):
     """Return a new keystone session based on configuration.
 
     Arguments:
         config (dict): a dictionary with the session configuration keys: ``auth_url``, ``username``, ``password``.
         project (str, optional): a project to scope the session to.
+        session (keystoneauth1.session.Session, optional): an already authenticated session. If specified, its token
+            is rescoped to the project instead of authenticating again with the password and its connections are
+            reused.
 
     Returns:
         keystoneauth1.session.Session: the Keystone session scoped for the project if specified.
 
     """
+    base_url = config.get('auth_url', 'http://localhost:5000')
+    auth_url = f'{base_url}/v3'
+    if session is not None:
+        auth = keystone_identity.Token(
+            auth_url=auth_url, token=session.get_token(), project_name=project, project_domain_id='default')
+        return keystone_session.Session(auth=auth, session=session.session)
+
     auth = keystone_identity.Password(
-        auth_url='{auth_url}/v3'.format(auth_url=config.get('auth_url', 'http://localhost:5000')),
+        auth_url=auth_url,
         username=config.get('username', 'username'),
         password=config.get('password', 'password'),
         project_name=project,
@@ -61,13 +77,15 @@ def _get_keystone_session(config, project=None):
     return keystone_session.Session(auth=auth)
 
 
-def _get_nova_client(config, project):
+def _get_nova_client(config, project, session=None):
     """Return a new nova client tailored to the given project.
 
     Arguments:
         config (dict): a dictionary with the session configuration keys: ``auth_url``, ``username``, ``password``,
             ``nova_api_version``, ``timeout``.
         project (str): the project to scope the `novaclient` session to.
+        session (keystoneauth1.session.Session, optional): an already authenticated session to rescope to the project,
+            see :py:func:`_get_keystone_session`.
 
     Returns:
         novaclient.client.Client: the novaclient Client instance, already authenticated.
@@ -76,7 +94,7 @@ def _get_nova_client(config, project):
     params = config.get('client_params', {})
     return nova_client.Client(
         config.get('nova_api_version', '2'),
-        session=_get_keystone_session(config, project),
+        session=_get_keystone_session(config, project, session=session),
         endpoint_type='public',
         timeout=config.get('timeout', 10),
         **params)
@@ -101,6 +119,8 @@ class OpenStackQuery(BaseQuery):
     * To mix multiple selections the general grammar must be used with multiple subqueries:
       ``O{project:project1} or O{project:project2}``
     * The special query ``*`` is a shortcut to select all hosts in all OpenStack projects.
+    * When querying all the projects, up to ``workers`` projects (16 by default) are queried in parallel.
+    * The servers of each project are listed in pages of ``page_size`` servers (1000 by default).
     * See the example configuration in ``doc/examples/config.yaml`` for all the OpenStack-related parameters that can
       be set.
 
@@ -116,8 +136,11 @@ class OpenStackQuery(BaseQuery):
       ``O{project:project1} or O{project:project2}``
     """
 
-    grammar = grammar()
-    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once in a singleton-like way."""
+    __slots__ = ('openstack_config', 'search_project', 'search_params')
+
+    grammar = LazyGrammar(grammar)
+    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once, when first used, in a singleton-like
+    way."""
 
     def __init__(self, config):
         """Override parent class constructor for specific setup.
@@ -169,8 +192,17 @@ class OpenStackQuery(BaseQuery):
         """
         if self.search_project is None:
             hosts = nodeset()
-            for project in self._get_projects():
-                hosts |= self._get_project_hosts(project)
+            session = _get_keystone_session(self.openstack_config)  # Authenticate only once for all the projects
+            projects = list(self._get_projects(session))
+            workers = min(self.openstack_config.get('workers', 16), len(projects))
+            if workers > 1:  # Query the projects in parallel, the time is spent waiting for the APIs
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    for project_hosts in executor.map(lambda project: self._get_project_hosts(project, session),
+                                                      projects):
+                        hosts |= project_hosts
+            else:
+                for project in projects:
+                    hosts |= self._get_project_hosts(project, session)
         else:
             hosts = self._get_project_hosts(self.search_project)
 
@@ -190,52 +222,67 @@ class OpenStackQuery(BaseQuery):
             raise InvalidQueryError('Expecting ParseResults object, got {type}: {token}'.format(
                 type=type(token), token=token))
 
-        token_dict = token.asDict()
-        self.logger.trace('Token is: %s | %s', token_dict, token)
+        if self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER):
+            self.logger.trace('Token is: %s | %s', token.asDict(), token)
 
-        if 'key' in token_dict and 'value' in token_dict:
-            if token_dict['key'] == 'project':
-                self.search_project = token_dict['value']
+        if 'key' in token and 'value' in token:
+            if token['key'] == 'project':
+                self.search_project = token['value']
             else:
-                self.search_params[token_dict['key']] = token_dict['value']
-        elif 'all' in token_dict:
+                self.search_params[token['key']] = token['value']
+        elif 'all' in token:
             pass  # nothing to do, search_project and search_params have the right defaults
         else:  # pragma: no cover - this should never happen
             raise InvalidQueryError('Got unexpected token: {token}'.format(token=token))
 
-    def _get_projects(self):
+    def _get_projects(self, session):
         """Get all the project names from keystone API, filtering out the special `admin` project. Is a `generator`.
 
+        Arguments:
+            session (keystoneauth1.session.Session): the unscoped Keystone session to use.
+
         Yields:
             str: the project name for all the selected projects.
 
         """
-        client = keystone_client.Client(
-            session=_get_keystone_session(self.openstack_config), timeout=self.openstack_config.get('timeout', 10))
+        client = keystone_client.Client(session=session, timeout=self.openstack_config.get('timeout', 10))
         return (project.name for project in client.projects.list(enabled=True) if project.name != 'admin')
 
-    def _get_project_hosts(self, project):
+    def _get_project_hosts(self, project, session=None):
         """Return a NodeSet with the list of matching hosts based for the project based on the search parameters.
 
         Arguments:
             project (str): the project name where to get the list of hosts.
+            session (keystoneauth1.session.Session, optional): an already authenticated session to rescope to the
+                project instead of authenticating again.
 
         Returns:
             ClusterShell.NodeSet.NodeSet: with the FQDNs of the matching hosts.
 
         """
-        client = _get_nova_client(self.openstack_config, project)
+        client = _get_nova_client(self.openstack_config, project, session=session)
 
         domain = ''
         domain_suffix = self.openstack_config.get('domain_suffix', None)
         if domain_suffix is not None:
             if domain_suffix[0] != '.':
-                domain = '.{suffix}'.format(suffix=domain_suffix)
+                domain = f'.{domain_suffix}'
             else:
                 domain = domain_suffix
 
-        return nodeset_fromlist('{host}.{project}{domain}'.format(host=server.name, project=project, domain=domain)
-                                for server in client.servers.list(search_opts=self.search_params))
+        suffix = f'.{project}{domain}'
+        page_size = self.openstack_config.get('page_size', 1000)
+        hosts = nodeset()
+        marker = None
+        while True:  # Get the servers one page at a time, without keeping all of them in memory
+            servers = client.servers.list(search_opts=self.search_params, marker=marker, limit=page_size)
+            if not servers:
+                break
+
+            hosts |= nodeset_fromlist([server.name + suffix for server in servers])
+            marker = servers[-1].id
+
+        return hosts
 
 
 GRAMMAR_PREFIX = 'O'
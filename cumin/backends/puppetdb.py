@@ -1,14 +1,15 @@
 """PuppetDB backend."""
+import functools
+import re
+import threading
 
-from re import IGNORECASE
+from collections import OrderedDict
 from string import capwords
 
 import pyparsing as pp
-import requests
-import urllib3
 
 from cumin import nodeset, nodeset_fromlist
-from cumin.backends import BaseQuery, InvalidQueryError
+from cumin.backends import BaseQuery, InvalidQueryError, LazyGrammar
 
 
 CATEGORIES = ('C', 'F', 'O', 'P', 'R')
@@ -27,6 +28,58 @@ OPERATORS = ('=', '>=', '<=', '<', '>', '~')
 The ``~`` one is used for regex matching.
 """
 
+QUERY_CACHE_SIZE = 128
+""":py:class:`int`: the maximum number of built PuppetDB queries to keep cached, the least recently used are dropped."""
+
+CAPWORDS_CACHE_SIZE = 2048
+""":py:class:`int`: the maximum number of resource types and class titles to keep cached with their capitalization."""
+
+_SPECIAL_CATEGORIES = frozenset(('C', 'O', 'P'))  # Shortcuts for querying resources of type Class
+
+# Characters and patterns shared by the pyparsing grammar and the hand-written parser
+_HOSTS_CHARS = pp.alphanums + '-_.*,!&^[]'  # Glob (*) and ClusterShell (,!&^[]) syntaxes are allowed
+_KEY_CHARS = pp.alphanums + '-_.%@:'
+# All printables characters except the parentheses that are part of this or the global grammar
+_VALUE_CHARS = ''.join([c for c in pp.printables if c not in ('(', ')', '{', '}')])
+# Caseless keywords: not preceded nor followed by other keyword characters, like pp.CaselessKeyword
+_BOOL_REGEX = r'(?<![A-Za-z0-9_$])(?:and|or)(?![A-Za-z0-9_$])'
+_OPERATORS_REGEX = '|'.join(re.escape(op) for op in sorted(OPERATORS, key=len, reverse=True))  # Longest first
+
+_WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+_BOOL_PATTERN = re.compile(_BOOL_REGEX, re.IGNORECASE)
+_NEG_PATTERN = re.compile(r'(?<![A-Za-z0-9_$])not(?![A-Za-z0-9_$])', re.IGNORECASE)
+_SELECTOR_PATTERN = re.compile(rf"((?i:[{''.join(CATEGORIES)}])):([{re.escape(_KEY_CHARS)}]+)")
+_OPERATOR_PATTERN = re.compile(_OPERATORS_REGEX)
+_HOSTS_PATTERN = re.compile(f'[{re.escape(_HOSTS_CHARS)}]+')
+_WORD_VALUE_PATTERN = re.compile(f'[{re.escape(_VALUE_CHARS)}]+')
+# The content of a quoted string up to the closing quote, the same of pp.quotedString
+_QUOTED_PATTERNS = {
+    '"': re.compile(r'"(?:[^"\n\r\\]|(?:"")|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*'),
+    "'": re.compile(r"'(?:[^'\n\r\\]|(?:'')|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*"),
+}
+# The JSON atoms values with their conversion, in the order in which they are preferred for matches of equal length
+_ATOM_PATTERNS = (
+    (re.compile(r'0x[0-9A-F]+', re.IGNORECASE), lambda value: int(value, 16)),  # Hexadecimal
+    (re.compile(r'0[0-7]+'), lambda value: int(value, 8)),  # Octal
+    (re.compile(r'[+-]?(?:\d+(?:[eE][+-]?\d+)|(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?)'), float),  # Real number
+    (re.compile(r'[+-]?\d+'), int),  # Integer number
+    (re.compile(r'true|false'), str),  # Bareword
+)
+
+
+@functools.lru_cache(maxsize=CAPWORDS_CACHE_SIZE)
+def _capwords(string):
+    """Capitalize each ``::`` separated part of a resource type or class title, caching the result.
+
+    Arguments:
+        string (str): the resource type or class title to capitalize.
+
+    Returns:
+        str: the capitalized string, the same of :py:func:`string.capwords` with ``::`` as separator.
+
+    """
+    return capwords(string, '::')
+
 
 class ParsedString:
     """Simple string wrapper which can communicate if a string should be enquoted downstream."""
@@ -45,7 +98,7 @@ class ParsedString:
     def __str__(self):
         """Return a string version of this value, enquoted or not based on the is_quoted property."""
         if self.is_quoted:
-            return '"{}"'.format(self.string)
+            return f'"{self.string}"'
         return self.string
 
     def capwords(self, sep):
@@ -55,6 +108,9 @@ class ParsedString:
             according to :py:meth:`string.capwords`.
 
         """
+        if sep == '::':
+            return ParsedString(_capwords(self.string), self.is_quoted)
+
         return ParsedString(capwords(self.string, sep), self.is_quoted)
 
     def replace(self, old, new, count=-1):
@@ -84,12 +140,14 @@ def grammar():  # pylint: disable=too-many-locals
         pyparsing.ParserElement: the grammar parser.
 
     """
-    # Boolean operators
-    and_or = (pp.CaselessKeyword('and') | pp.CaselessKeyword('or'))('bool')
+    # Boolean operators, a single regex with the same word boundaries of pp.CaselessKeyword, normalized to lowercase
+    and_or = pp.Regex(_BOOL_REGEX, flags=re.IGNORECASE).setParseAction(
+        lambda toks: toks[0].lower())('bool')
     # 'neg' is used as label to allow the use of dot notation, 'not' is a reserved word in Python
     neg = pp.CaselessKeyword('not')('neg')
 
-    operator = pp.oneOf(OPERATORS, caseless=True)('operator')  # Comparison operators
+    # Comparison operators, a single regex with the longest operators first
+    operator = pp.Regex(_OPERATORS_REGEX)('operator')
     quoted_string = pp.quotedString.copy().addParseAction(pp.removeQuotes)  # Both single and double quotes are allowed
 
     # Parentheses
@@ -98,15 +156,14 @@ def grammar():  # pylint: disable=too-many-locals
 
     # Hosts selection: glob (*) and clustershell (,!&^[]) syntaxes are allowed:
     # i.e. host10[10-42].*.domain
-    hosts = quoted_string | (~(and_or | neg) + pp.Word(pp.alphanums + '-_.*,!&^[]'))
+    hosts = quoted_string | (~(and_or | neg) + pp.Word(_HOSTS_CHARS))
 
     # Key-value token for allowed categories using the available comparison operators
     # i.e. F:key = value
-    category = pp.oneOf(CATEGORIES, caseless=True)('category')
-    key = pp.Word(pp.alphanums + '-_.%@:')('key')
+    category = pp.Regex(f"[{''.join(CATEGORIES)}]", flags=re.IGNORECASE).setParseAction(
+        lambda toks: toks[0].upper())('category')
+    key = pp.Word(_KEY_CHARS)('key')
     selector = pp.Combine(category + ':' + key)  # i.e. F:key
-    # All printables characters except the parentheses that are part of this or the global grammar
-    all_but_par = ''.join([c for c in pp.printables if c not in ('(', ')', '{', '}')])
 
     # PuppetDB accepts JSON Atoms
     bareword = pp.oneOf(('true', 'false'))
@@ -114,11 +171,11 @@ def grammar():  # pylint: disable=too-many-locals
     # octal numbers are bare numerics that lead with 0.
     octal = pp.Word("0", "01234567", min=2).addParseAction(lambda toks: int(toks[0], 8))
     # hex integers are in the format 0x[0-9A-F]+
-    hexadecimal = pp.Regex(r'0x[0-9A-F]+', flags=IGNORECASE).addParseAction(lambda toks: int(toks[0], 16))
+    hexadecimal = pp.Regex(r'0x[0-9A-F]+', flags=re.IGNORECASE).addParseAction(lambda toks: int(toks[0], 16))
     number = pp.pyparsing_common.number
 
     # label indicates post-processing needed (value = nonquoted, quoted=quoted)
-    value = (hexadecimal ^ octal ^ number ^ bareword)('value') ^ (quoted_string ^ pp.Word(all_but_par))('quoted')
+    value = (hexadecimal ^ octal ^ number ^ bareword)('value') ^ (quoted_string ^ pp.Word(_VALUE_CHARS))('quoted')
 
     token = selector + pp.Optional(operator + value)
 
@@ -132,6 +189,225 @@ def grammar():  # pylint: disable=too-many-locals
     return full_grammar
 
 
+class QueryParser:
+    """Hand-written recursive-descent parser for the PuppetDB backend queries.
+
+    It accepts the same language of the pyparsing grammar defined in :py:func:`grammar`, with the same values
+    conversions, without generating any intermediate parse result. It returns instead the flat list of the parsed
+    tokens, in the same order in which they would be processed from the pyparsing results.
+
+    Each token is a tuple with its type and its value:
+
+    * ``('open', None)`` and ``('close', None)``: a subgroup is opened or closed.
+    * ``('bool', bool_operator)``: a boolean operator, ``and`` or ``or``.
+    * ``('hosts', (hosts, neg))``: a hosts selection string and whether it's negated.
+    * ``('category', params)``: a category token with the keyword arguments for
+      :py:meth:`PuppetDBQuery._add_category`.
+
+    """
+
+    __slots__ = ('text', 'pos', 'tokens')
+
+    def __init__(self, text):
+        """Parser constructor.
+
+        Arguments:
+            text (str): the query string to parse.
+
+        """
+        self.text = text
+        self.pos = 0
+        self.tokens = []
+
+    def parse(self):
+        """Parse the whole query string.
+
+        Returns:
+            list: the parsed tokens.
+
+        Raises:
+            pyparsing.ParseException: if the query string is not valid, for consistency with the other backends.
+
+        """
+        self._parse_grammar()
+        self._skip_whitespace()
+        if self.pos != len(self.text):
+            self._fail('Expected end of text')
+
+        return self.tokens
+
+    def _parse_grammar(self):
+        """Parse a ``<grammar>``: an item followed by any number of boolean operator and item pairs."""
+        self._parse_item()
+        while True:
+            self._skip_whitespace()
+            match = _BOOL_PATTERN.match(self.text, self.pos)
+            if match is None:
+                return
+
+            self.pos = match.end()
+            self.tokens.append(('bool', match.group().lower()))
+            self._parse_item()
+
+    def _parse_item(self):
+        """Parse an ``<item>``: either a category token or hosts, or a subgroup, optionally negated."""
+        text = self.text
+        self._skip_whitespace()
+        match = _NEG_PATTERN.match(text, self.pos)
+        neg = match is not None
+        if neg:
+            self.pos = match.end()
+
+        self._skip_whitespace()
+        if self._parse_category(neg) or self._parse_hosts(neg):
+            return
+
+        if self.pos < len(text) and text[self.pos] == '(':
+            self.pos += 1
+            self.tokens.append(('open', None))
+            self._parse_grammar()
+            self._skip_whitespace()
+            if self.pos >= len(text) or text[self.pos] != ')':
+                self._fail("Expected ')'")
+
+            self.pos += 1
+            self.tokens.append(('close', None))
+            return
+
+        self._fail("Expected a category token, hosts or '('")
+
+    def _parse_category(self, neg):
+        """Parse a category token ``<category>:<key> [<operator> <value>]``, if present at the current position.
+
+        Arguments:
+            neg (bool): whether the token is negated.
+
+        Returns:
+            bool: :py:data:`True` if a category token was parsed, :py:data:`False` otherwise.
+
+        """
+        match = _SELECTOR_PATTERN.match(self.text, self.pos)
+        if match is None:
+            return False
+
+        self.pos = match.end()
+        params = {'category': match.group(1).upper(), 'key': match.group(2)}
+        if neg:
+            params['neg'] = True
+
+        self._skip_whitespace()
+        operator = _OPERATOR_PATTERN.match(self.text, self.pos)
+        if operator is not None:
+            self.pos = operator.end()
+            self._skip_whitespace()
+            value = self._parse_value()
+            if value is None:  # The operator and the value are optional together, like with pyparsing
+                self.pos = match.end()
+            else:
+                params['operator'] = operator.group()
+                params['value'] = value
+
+        self.tokens.append(('category', params))
+        return True
+
+    def _parse_value(self):
+        """Parse a ``<value>`` at the current position, preferring the longest match like pyparsing's Or.
+
+        The JSON atoms are preferred to the strings for matches of equal length.
+
+        Returns:
+            cumin.backends.puppetdb.ParsedString, None: the parsed value or :py:data:`None` if there is no match.
+
+        """
+        text = self.text
+        start = self.pos
+        end = -1
+        value = None
+        for pattern, convert in _ATOM_PATTERNS:
+            match = pattern.match(text, start)
+            if match is not None and match.end() > end:
+                end = match.end()
+                value = ParsedString(convert(match.group()), False)
+
+        quoted_end = self._match_quoted()
+        if quoted_end > end:
+            end = quoted_end
+            value = ParsedString(text[start + 1:quoted_end - 1], True)
+
+        match = _WORD_VALUE_PATTERN.match(text, start)
+        if match is not None and match.end() > end:
+            end = match.end()
+            value = ParsedString(match.group(), True)
+
+        if value is not None:
+            self.pos = end
+
+        return value
+
+    def _parse_hosts(self, neg):
+        """Parse ``<hosts>``, quoted or not, if present at the current position.
+
+        Arguments:
+            neg (bool): whether the hosts are negated.
+
+        Returns:
+            bool: :py:data:`True` if the hosts were parsed, :py:data:`False` otherwise.
+
+        """
+        text = self.text
+        start = self.pos
+        quoted_end = self._match_quoted()
+        if quoted_end != -1:
+            self.pos = quoted_end
+            self.tokens.append(('hosts', (text[start + 1:quoted_end - 1], neg)))
+            return True
+
+        if _BOOL_PATTERN.match(text, start) is not None or _NEG_PATTERN.match(text, start) is not None:
+            return False  # The boolean operators are not valid hosts
+
+        match = _HOSTS_PATTERN.match(text, start)
+        if match is None:
+            return False
+
+        self.pos = match.end()
+        self.tokens.append(('hosts', (match.group(), neg)))
+        return True
+
+    def _match_quoted(self):
+        """Match a quoted string at the current position, like pp.quotedString, without moving the position.
+
+        Returns:
+            int: the position after the closing quote or -1 if there is no quoted string.
+
+        """
+        text = self.text
+        pattern = _QUOTED_PATTERNS.get(text[self.pos:self.pos + 1])
+        if pattern is None:
+            return -1
+
+        end = pattern.match(text, self.pos).end()
+        if text[end:end + 1] != text[self.pos]:
+            return -1
+
+        return end + 1
+
+    def _skip_whitespace(self):
+        """Move the current position after any whitespace."""
+        self.pos = _WHITESPACE_PATTERN.match(self.text, self.pos).end()
+
+    def _fail(self, message):
+        """Raise a parsing exception at the current position.
+
+        Arguments:
+            message (str): the error message.
+
+        Raises:
+            pyparsing.ParseException: always.
+
+        """
+        raise pp.ParseException(self.text, self.pos, message)
+
+
 class PuppetDBQuery(BaseQuery):
     """PuppetDB query builder.
 
@@ -198,6 +474,9 @@ class PuppetDBQuery(BaseQuery):
       ``host10[10-42].*.domain or (not F:key1 = value1 and host10*) or (F:key2 > value2 and F:key3 ~ '^value[0-9]+')``
     """
 
+    __slots__ = ('grouped_tokens', 'current_group', 'group_parents', 'puppetdb_query', '_endpoint', 'url', 'timeout',
+                 'ssl_verify', 'ssl_client_cert', 'ssl_client_key')
+
     base_url_template = '{scheme}://{host}:{port}/pdb/query/v4/'
     """:py:class:`str`: string template in the :py:meth:`str.format` style used to generate the base URL of the
     PuppetDB server."""
@@ -209,8 +488,16 @@ class PuppetDBQuery(BaseQuery):
     category_prefixes = {'C': '', 'O': 'Role', 'P': 'Profile'}
     """:py:class:`dict`: dictionary with the mapping of special categories to title prefixes."""
 
-    grammar = grammar()
-    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once in a singleton-like way."""
+    grammar = LazyGrammar(grammar)
+    """:py:class:`pyparsing.ParserElement`: load the grammar parser only once, when first used, in a singleton-like way.
+    Kept for backward compatibility, the queries are parsed with a faster hand-written parser that accepts the same
+    language, see :py:class:`cumin.backends.puppetdb.QueryParser`."""
+
+    _query_cache = OrderedDict()  # LRU cache of the built queries by query string, shared by all the instances
+    _query_cache_lock = threading.Lock()
+
+    _session = None  # The requests session shared by all the instances, to reuse the connections to PuppetDB
+    _session_lock = threading.Lock()
 
     def __init__(self, config):
         """Query constructor for the PuppetDB backend.
@@ -222,6 +509,8 @@ class PuppetDBQuery(BaseQuery):
         super().__init__(config)
         self.grouped_tokens = None
         self.current_group = self.grouped_tokens
+        self.group_parents = []  # The enclosing groups of the current one, used only while building the query
+        self.puppetdb_query = None
         self._endpoint = None
         puppetdb_config = self.config.get('puppetdb', {})
         self.url = self.base_url_template.format(
@@ -234,8 +523,13 @@ class PuppetDBQuery(BaseQuery):
         self.ssl_client_cert = puppetdb_config.get('ssl_client_cert', '')
         self.ssl_client_key = puppetdb_config.get('ssl_client_key', '')
 
-        for exception in puppetdb_config.get('urllib3_disable_warnings', []):
-            urllib3.disable_warnings(category=getattr(urllib3.exceptions, exception))
+        disable_warnings = puppetdb_config.get('urllib3_disable_warnings', [])
+        if disable_warnings:
+            # Imported here to not pay its import cost when no warning needs to be disabled
+            import urllib3  # pylint: disable=import-outside-toplevel
+
+            for exception in disable_warnings:
+                urllib3.disable_warnings(category=getattr(urllib3.exceptions, exception))
 
     @property
     def endpoint(self):
@@ -267,13 +561,13 @@ class PuppetDBQuery(BaseQuery):
     def _open_subgroup(self):
         """Handle subgroup opening."""
         token = PuppetDBQuery._get_grouped_tokens()
-        token['parent'] = self.current_group
         self.current_group['tokens'].append(token)
+        self.group_parents.append(self.current_group)
         self.current_group = token
 
     def _close_subgroup(self):
         """Handle subgroup closing."""
-        self.current_group = self.current_group['parent']
+        self.current_group = self.group_parents.pop()
 
     @staticmethod
     def _get_grouped_tokens():
@@ -283,19 +577,60 @@ class PuppetDBQuery(BaseQuery):
             dict: the dictionary with the empty grouped tokens structure.
 
         """
-        return {'parent': None, 'bool': None, 'tokens': []}
+        return {'bool': None, 'tokens': []}
 
     def _build(self, query_string):
-        """Override parent class _build method to reset tokens and add logging.
+        """Override parent class _build method to parse the query without pyparsing and build the PuppetDB query.
+
+        The built queries are cached by query string and reused also by other instances.
 
         :Parameters:
             according to parent :py:meth:`cumin.backends.BaseQuery._build`.
 
+        Raises:
+            pyparsing.ParseException: if the query string is not valid.
+
         """
+        query_string = query_string.strip()
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query_string)
+            if cached is not None:
+                self._query_cache.move_to_end(query_string)
+
+        if cached is not None:  # The grouped tokens are never modified after the build, they can be safely reused
+            endpoint, self.grouped_tokens, self.puppetdb_query = cached
+            self.current_group = self.grouped_tokens
+            if endpoint is not None:
+                self.endpoint = endpoint
+            self.logger.trace('Query tokens from cache: %s', self.grouped_tokens)
+            return
+
         self.grouped_tokens = PuppetDBQuery._get_grouped_tokens()
         self.current_group = self.grouped_tokens
-        super()._build(query_string)
+        self.group_parents = []
+        self.logger.trace('Parsing query: %s', query_string)
+        query_endpoint = None  # The endpoint set by this query, the instance one might be left from a previous query
+        # Build the query only once the whole query is known to be valid, like when parsing it with pyparsing
+        for token_type, value in QueryParser(query_string).parse():
+            if token_type == 'category':
+                self._add_category(**value)
+                query_endpoint = self.endpoints[value['category']]
+            elif token_type == 'hosts':
+                hosts, neg = value
+                self._add_hosts([nodeset(hosts)], neg=neg)
+            elif token_type == 'bool':
+                self._add_bool(value)
+            elif token_type == 'open':
+                self._open_subgroup()
+            else:
+                self._close_subgroup()
+
+        self.puppetdb_query = self._get_query_string(group=self.grouped_tokens)
         self.logger.trace('Query tokens: %s', self.grouped_tokens)
+        with self._query_cache_lock:
+            self._query_cache[query_string] = (query_endpoint, self.grouped_tokens, self.puppetdb_query)
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
 
     def _execute(self):
         """Concrete implementation of parent abstract method.
@@ -307,9 +642,10 @@ class PuppetDBQuery(BaseQuery):
             ClusterShell.NodeSet.NodeSet: with the FQDNs of the matching hosts.
 
         """
-        query = self._get_query_string(group=self.grouped_tokens)
+        query = self.puppetdb_query
         full_query = f'["extract", ["certname"], {query}, ["group_by", "certname"]]'
-        hosts = nodeset_fromlist([host['certname'] for host in self._api_call(full_query)])
+        # Add the hosts to the NodeSet one at a time, without building an intermediate list of all the hostnames
+        hosts = nodeset_fromlist(host['certname'] for host in self._api_call(full_query))
         self.logger.debug("Queried puppetdb for '%s', got '%d' results.", query, len(hosts))
         return hosts
 
@@ -327,23 +663,26 @@ class PuppetDBQuery(BaseQuery):
             cumin.backends.InvalidQueryError: on internal parsing error.
 
         """
-        self.endpoint = self.endpoints[category]
+        endpoint = self.endpoints[category]
+        if endpoint != self._endpoint:  # Validate the endpoint only once, any following token must match it
+            self.endpoint = endpoint
+
         if operator == '~':
             # PuppetDB API requires to escape every backslash
             # See: https://puppet.com/docs/puppetdb/4.4/api/query/v4/ast.html#regexp-match
             value = value.replace('\\', '\\\\')
-        if category in ('C', 'O', 'P'):
+        if category in _SPECIAL_CATEGORIES:
             query = self._get_special_resource_query(category, key, value, operator)
         elif category == 'R':
             query = self._get_resource_query(key, value, operator)
         elif category == 'F':
-            query = '["{op}", ["fact", "{key}"], {val}]'.format(op=operator, key=key, val=value)
+            query = f'["{operator}", ["fact", "{key}"], {value}]'
         else:  # pragma: no cover - this should never happen
             raise InvalidQueryError(
                 "Got invalid category '{category}', one of F|O|P|R expected".format(category=category))
 
         if neg:
-            query = '["not", {query}]'.format(query=query)
+            query = f'["not", {query}]'
 
         self.current_group['tokens'].append(query)
 
@@ -355,23 +694,38 @@ class PuppetDBQuery(BaseQuery):
             neg (bool, optional): whether the token must be negated.
 
         """
-        hosts_tokens = []
+        literals = []
+        globs = []
         for hosts_set in hosts:
             for host in hosts_set:
-                operator = '='
-                # Convert a glob expansion into a regex
-                if '*' in host:
-                    operator = '~'
-                    host = r'^' + host.replace('.', r'\\.').replace('*', '.*') + r'$'
+                if '*' in host:  # Convert a glob expansion into a regex
+                    globs.append(host.replace('.', r'\\.').replace('*', '.*'))
+                else:
+                    literals.append(f'"{host}"')
 
-                hosts_tokens.append('["{op}", "certname", "{host}"]'.format(op=operator, host=host))
+        hosts_tokens = []
+        # Match all the literal hosts at once, PuppetDB looks them up in a set instead of evaluating one clause each
+        if len(literals) == 1:
+            hosts_tokens.append(f'["=", "certname", {literals[0]}]')
+        elif literals:
+            literals_array = ', '.join(literals)
+            hosts_tokens.append(f'["in", "certname", ["array", [{literals_array}]]]')
+
+        # Match all the globs with a single regex, instead of evaluating one regex clause each
+        if len(globs) == 1:
+            hosts_tokens.append(f'["~", "certname", "^{globs[0]}$"]')
+        elif globs:
+            globs_regex = '|'.join(globs)
+            hosts_tokens.append(f'["~", "certname", "^({globs_regex})$"]')
 
         if not hosts_tokens:
             return
 
-        query = '["or", {hosts}]'.format(hosts=', '.join(hosts_tokens))
+        hosts_query = ', '.join(hosts_tokens)
+        query = f'["or", {hosts_query}]'
+
         if neg:
-            query = '["not", {query}]'.format(query=query)
+            query = f'["not", {query}]'
 
         self.current_group['tokens'].append(query)
 
@@ -388,37 +742,41 @@ class PuppetDBQuery(BaseQuery):
         if isinstance(token, str):
             return
 
-        token_dict = token.asDict()
-        # post-process types
-        if 'quoted' in token_dict:
-            token_dict['value'] = ParsedString(token_dict['quoted'], True)
-            del token_dict['quoted']
-        elif 'value' in token_dict:
-            token_dict['value'] = ParsedString(token_dict['value'], False)
-
-        # Based on the token type build the corresponding query object
-        if 'open_subgroup' in token_dict:
+        # Based on the token type build the corresponding query object, accessing the named results directly
+        if 'open_subgroup' in token:
             self._open_subgroup()
             for subtoken in token:
                 self._parse_token(subtoken)
             self._close_subgroup()
 
-        elif 'bool' in token_dict:
-            self._add_bool(token_dict['bool'])
+        elif 'bool' in token:
+            self._add_bool(token['bool'])
+
+        elif 'hosts' in token:
+            hosts = token['hosts']
+            if isinstance(hosts, str):  # Backward compatibility with PyParsing <2.3.1
+                hosts = [hosts]
 
-        elif 'hosts' in token_dict:
-            if isinstance(token_dict['hosts'], str):  # Backward compatibility with PyParsing <2.3.1
-                token_dict['hosts'] = [token_dict['hosts']]
+            self._add_hosts([nodeset(token_hosts) for token_hosts in hosts], neg=bool(token.get('neg', False)))
 
-            token_dict['hosts'] = [nodeset(token_hosts) for token_hosts in token_dict['hosts']]
-            self._add_hosts(**token_dict)
+        elif 'category' in token:
+            params = {'category': token['category'], 'key': token['key']}
+            # post-process types
+            if 'quoted' in token:
+                params['value'] = ParsedString(token['quoted'], True)
+            elif 'value' in token:
+                params['value'] = ParsedString(token['value'], False)
+            if 'operator' in token:
+                params['operator'] = token['operator']
+            if 'neg' in token:
+                params['neg'] = token['neg']
 
-        elif 'category' in token_dict:
-            self._add_category(**token_dict)
+            self._add_category(**params)
 
         else:  # pragma: no cover - this should never happen
             raise InvalidQueryError(
-                "No valid key found in token, one of bool|hosts|category expected: {token}".format(token=token_dict))
+                "No valid key found in token, one of bool|hosts|category expected: {token}".format(
+                    token=token.asDict()))
 
     def _get_resource_query(self, key, value=None, operator='='):
         """Build a resource query based on the parameters, resolving the special cases for ``%params`` and ``@field``.
@@ -435,19 +793,19 @@ class PuppetDBQuery(BaseQuery):
             cumin.backends.InvalidQueryError: on invalid combinations of parameters.
 
         """
-        if all(char in key for char in ('%', '@')):
+        if '%' in key and '@' in key:
             raise InvalidQueryError(("Resource key cannot contain both '%' (query a resource's parameter) and '@' "
                                      "(query a  resource's field)"))
 
         if '%' in key:
             # Querying a specific parameter of the resource
             key, param = key.split('%', 1)
-            query_part = ', ["{op}", ["parameter", "{param}"], {value}]'.format(op=operator, param=param, value=value)
+            query_part = f', ["{operator}", ["parameter", "{param}"], {value}]'
 
         elif '@' in key:
             # Querying a specific field of the resource
             key, field = key.split('@', 1)
-            query_part = ', ["{op}", "{field}", {value}]'.format(op=operator, field=field, value=value)
+            query_part = f', ["{operator}", "{field}", {value}]'
 
         elif value is None:
             # Querying a specific resource type
@@ -457,8 +815,9 @@ class PuppetDBQuery(BaseQuery):
             # Querying a specific resource title
             if key.lower() == 'class' and operator != '~':
                 value = value.capwords('::')  # Auto ucfirst the class title
-            query_part = ', ["{op}", "title", {value}]'.format(op=operator, value=value)
-        query = '["and", ["=", "type", "{type}"]{query_part}]'.format(type=capwords(key, '::'), query_part=query_part)
+            query_part = f', ["{operator}", "title", {value}]'
+        resource_type = _capwords(key)
+        query = f'["and", ["=", "type", "{resource_type}"]{query_part}]'
 
         return query
 
@@ -478,7 +837,7 @@ class PuppetDBQuery(BaseQuery):
             cumin.backends.InvalidQueryError: on invalid combinations of parameters.
 
         """
-        if all(char in key for char in ('%', '@')):
+        if '%' in key and '@' in key:
             raise InvalidQueryError(("Resource key cannot contain both '%' (query a resource's parameter) and '@' "
                                      "(query a  resource's field)"))
         param = None
@@ -495,7 +854,7 @@ class PuppetDBQuery(BaseQuery):
                                          "is accepted only when using %param or @field.").format(category=category))
 
         if self.category_prefixes[category]:
-            title = ParsedString('{prefix}::{key}'.format(prefix=self.category_prefixes[category], key=key), True)
+            title = ParsedString(f'{self.category_prefixes[category]}::{key}', True)
         else:
             title = ParsedString(key, True)
 
@@ -504,12 +863,12 @@ class PuppetDBQuery(BaseQuery):
         if special is not None:
             # pylint: disable-next=possibly-used-before-assignment
             param_query = self._get_resource_query(''.join(('Class', special, param)), value, operator)
-            query = '["and", {query}, {param_query}]'.format(query=query, param_query=param_query)
+            query = f'["and", {query}, {param_query}]'
 
         return query
 
     def _get_query_string(self, group):
-        """Recursively build and return the PuppetDB query string.
+        """Build and return the PuppetDB query string, traversing the grouped tokens without recursion.
 
         Arguments:
             group (dict): a dictionary with the grouped tokens.
@@ -518,25 +877,24 @@ class PuppetDBQuery(BaseQuery):
             str: the query string for the PuppetDB API.
 
         """
-        if group['bool']:
-            query = '["{bool}", '.format(bool=group['bool'])
-        else:
-            query = ''
-
-        last_index = len(group['tokens'])
-        for i, token in enumerate(group['tokens']):
-            if isinstance(token, dict):
-                query += self._get_query_string(group=token)
-            else:
-                query += token
+        parts = []
+        stack = [group]  # Groups still to be expanded and strings to append as they are, in reverse order
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, dict):
+                parts.append(item)
+                continue
 
-            if i < last_index - 1:
-                query += ', '
+            if item['bool']:
+                parts.append(f'["{item["bool"]}", ')
+                stack.append(']')
 
-        if group['bool']:
-            query += ']'
+            for i, token in enumerate(reversed(item['tokens'])):
+                if i:
+                    stack.append(', ')
+                stack.append(token)
 
-        return query
+        return ''.join(parts)
 
     def _add_bool(self, bool_op):
         """Add a boolean AND or OR query block to the query and validate logic.
@@ -556,6 +914,26 @@ class PuppetDBQuery(BaseQuery):
             raise InvalidQueryError("Got unexpected '{bool}' boolean operator, current operator was '{current}'".format(
                 bool=bool_op, current=self.current_group['bool']))
 
+    @staticmethod
+    def _get_session():
+        """Return the requests session shared by all the instances, creating it on first use.
+
+        Reusing the same session allows to keep the connections to PuppetDB alive across queries, avoiding a new TCP
+        connection and TLS handshake for each of them. The per-query settings are passed to each request.
+
+        Returns:
+            requests.Session: the shared session.
+
+        """
+        with PuppetDBQuery._session_lock:
+            if PuppetDBQuery._session is None:
+                # Imported here to not pay the requests import cost when no PuppetDB query is executed
+                import requests  # pylint: disable=import-outside-toplevel
+
+                PuppetDBQuery._session = requests.Session()
+
+            return PuppetDBQuery._session
+
     def _api_call(self, query):
         """Execute a query to PuppetDB API and return the parsed JSON.
 
@@ -579,7 +957,7 @@ class PuppetDBQuery(BaseQuery):
 
         params['json'] = {'query': query}
 
-        resources = requests.post(self.url + self.endpoint, **params)  # nosec
+        resources = self._get_session().post(self.url + self.endpoint, **params)  # nosec
         resources.raise_for_status()
         return resources.json()
 
@@ -1,6 +1,7 @@
 """Query grammar definition."""
 import importlib
 import pkgutil
+import sys
 
 from collections import namedtuple
 
@@ -13,6 +14,10 @@ INTERNAL_BACKEND_PREFIX = 'cumin.backends'
 """:py:class:`str` with the prefix for built-in backends."""
 
 
+_INTERNAL_BACKEND_NAMES = None
+"""Cache of the full module names of the built-in backends, populated on the first call to
+:py:func:`cumin.grammar.get_registered_backends`."""
+
 Backend = namedtuple('Backend', ['keyword', 'name', 'cls'])
 """:py:func:`collections.namedtuple` that define a Backend object.
 
@@ -36,11 +41,13 @@ def get_registered_backends(external=()):
         cumin.CuminError: If unable to register a backend.
 
     """
-    available_backends = {}
-    backend_names = ['{prefix}.{backend}'.format(prefix=INTERNAL_BACKEND_PREFIX, backend=name)
-                     for _, name, ispkg in pkgutil.iter_modules(backends.__path__) if not ispkg]
+    global _INTERNAL_BACKEND_NAMES  # pylint: disable=global-statement
+    if _INTERNAL_BACKEND_NAMES is None:  # Walk the backends directory only once
+        _INTERNAL_BACKEND_NAMES = tuple(f'{INTERNAL_BACKEND_PREFIX}.{name}'
+                                        for _, name, ispkg in pkgutil.iter_modules(backends.__path__) if not ispkg)
 
-    for name in backend_names + list(external):
+    available_backends = {}
+    for name in _INTERNAL_BACKEND_NAMES + tuple(external):
         keyword, backend = _import_backend(name, available_backends)
         if keyword is not None and backend is not None:
             available_backends[keyword] = backend
@@ -123,27 +130,26 @@ def _import_backend(module, available_backends):
         backend = importlib.import_module(module)
     except ImportError as e:
         if not module.startswith(INTERNAL_BACKEND_PREFIX):
-            raise CuminError("Unable to import backend '{module}': {e}".format(module=module, e=e)) from e
+            raise CuminError(f"Unable to import backend '{module}': {e}") from e
 
         return (None, None)  # Internal backend not available, are all the dependencies installed?
 
-    name = module.split('.')[-1]
-    message = "Unable to register backend '{name}' in module '{module}'".format(name=name, module=module)
+    name = sys.intern(module.split('.')[-1])  # Backend names are compared against the configuration values
+    message = f"Unable to register backend '{name}' in module '{module}'"
     try:
         keyword = backend.GRAMMAR_PREFIX
     except AttributeError as e:
-        raise CuminError('{message}: GRAMMAR_PREFIX module attribute not found'.format(message=message)) from e
+        raise CuminError(f'{message}: GRAMMAR_PREFIX module attribute not found') from e
 
     if keyword in available_backends:
-        raise CuminError(("{message}: keyword '{key}' already registered: {backends}").format(
-            message=message, key=keyword, backends=available_backends))
+        raise CuminError(f"{message}: keyword '{keyword}' already registered: {available_backends}")
 
     try:
         class_obj = backend.query_class
     except AttributeError as e:
-        raise CuminError('{message}: query_class module attribute not found'.format(message=message)) from e
+        raise CuminError(f'{message}: query_class module attribute not found') from e
 
     if not issubclass(class_obj, backends.BaseQuery):
-        raise CuminError('{message}: query_class module attribute is not a subclass of cumin.backends.BaseQuery')
+        raise CuminError(f'{message}: query_class module attribute is not a subclass of cumin.backends.BaseQuery')
 
     return (keyword, Backend(name=name, keyword=keyword, cls=class_obj))
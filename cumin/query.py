@@ -1,7 +1,9 @@
 """Query handling: factory and builder."""
+from concurrent.futures import ThreadPoolExecutor
+
 from pyparsing import ParseException, ParseResults
 
-from cumin import grammar
+from cumin import grammar, LOGGING_TRACE_LEVEL_NUMBER, nodeset
 from cumin.backends import BaseQuery, BaseQueryAggregator, InvalidQueryError
 
 
@@ -13,6 +15,9 @@ class Query(BaseQueryAggregator):
     default backend and only if the query is not parsable with that backend it will try to execute it with the
     multi-query grammar.
 
+    The backend subqueries of the multi-query grammar are independent from each other, up to ``subquery_workers`` of
+    them (1 by default) are executed in parallel.
+
     When a query is executed, a :py:class:`ClusterShell.NodeSet.NodeSet` with the FQDN of the matched hosts is
     returned.
 
@@ -35,6 +40,7 @@ class Query(BaseQueryAggregator):
         external = self.config.get('plugins', {}).get('backends', [])
         self.registered_backends = grammar.get_registered_backends(external=external)
         self.grammar = grammar.grammar(self.registered_backends.keys())
+        self.subqueries = []  # The backend subqueries to execute, with the hosts NodeSet to update with their results
 
     def execute(self, query_string):
         """Override parent class execute method to implement the multi-query capability.
@@ -71,6 +77,38 @@ class Query(BaseQueryAggregator):
 
         return hosts
 
+    def _build(self, query_string):
+        """Override parent method to reset the backend subqueries to execute.
+
+        :Parameters:
+            according to parent :py:meth:`cumin.backends.BaseQueryAggregator._build`.
+
+        """
+        self.subqueries = []
+        super()._build(query_string)
+
+    def _execute(self):
+        """Override parent method to execute first all the backend subqueries, in parallel if configured.
+
+        :Parameters:
+            according to parent :py:meth:`cumin.backends.BaseQueryAggregator._execute`.
+
+        Returns:
+            ClusterShell.NodeSet.NodeSet: with the FQDNs of the matching hosts.
+
+        """
+        workers = min(self.config.get('subquery_workers', 1), len(self.subqueries))
+        if workers > 1:  # Execute the subqueries in parallel, the time is spent waiting for the backends
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda subquery: subquery[1].execute(subquery[2]), self.subqueries))
+        else:
+            results = [query.execute(query_string) for _, query, query_string in self.subqueries]
+
+        for (hosts, _, _), subquery_hosts in zip(self.subqueries, results):
+            hosts.update(subquery_hosts)  # Updated in place, the stack elements reference the same NodeSet
+
+        return super()._execute()
+
     def _query_default_backend(self, query_string):
         """Execute the query with the default backend, according to the configuration.
 
@@ -111,7 +149,8 @@ class Query(BaseQueryAggregator):
                 type=type(token), token=token))
 
         token_dict = token.asDict()
-        self.logger.trace('Token is: %s', token_dict)
+        if self.logger.isEnabledFor(LOGGING_TRACE_LEVEL_NUMBER):
+            self.logger.trace('Token is: %s', token_dict)
 
         if self._replace_alias(token_dict):
             return  # This token was an alias and got replaced
@@ -119,14 +158,15 @@ class Query(BaseQueryAggregator):
         if 'backend' in token_dict and 'query' in token_dict:
             element = self._get_stack_element()
             query = self.registered_backends[token_dict['backend']].cls(self.config)
-            element['hosts'] = query.execute(token_dict['query'])
+            element.hosts = nodeset()  # Filled with the subquery results on execution, see _execute()
+            self.subqueries.append((element.hosts, query, token_dict['query']))
             if 'bool' in token_dict:
-                element['bool'] = token_dict['bool']
-            self.stack_pointer['children'].append(element)
+                element.bool = token_dict['bool']
+            self.stack_pointer.children.append(element)
         elif 'open_subgroup' in token_dict and 'close_subgroup' in token_dict:
             self._open_subgroup()
             if 'bool' in token_dict:
-                self.stack_pointer['bool'] = token_dict['bool']
+                self.stack_pointer.bool = token_dict['bool']
             for subtoken in token:
                 if isinstance(subtoken, str):
                     continue
@@ -158,7 +198,7 @@ class Query(BaseQueryAggregator):
 
         self._open_subgroup()
         if 'bool' in token_dict:
-            self.stack_pointer['bool'] = token_dict['bool']
+            self.stack_pointer.bool = token_dict['bool']
 
         # Calling BaseQuery._build() directly and not the parent's one to avoid resetting the stack
         BaseQuery._build(self, self.config['aliases'][alias_name])  # pylint: disable=protected-access
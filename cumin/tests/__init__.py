@@ -24,6 +24,17 @@ def get_fixture(path, as_string=False):
     return content
 
 
+def get_grammar_fixture_lines(name):
+    """Return the non-empty and non-comment lines of a backend grammar fixture, each one a query string.
+
+    Arguments:
+        name: the file name of the fixture in the backends grammars fixture directory.
+
+    """
+    lines = get_fixture(os.path.join('backends', 'grammars', name))
+    return [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+
+
 def get_fixture_path(path):
     """Return the absolute path of the given fixture.
 
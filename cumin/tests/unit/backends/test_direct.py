@@ -1,7 +1,14 @@
 """Direct backend tests."""
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from pyparsing import ParseException
 
 from cumin import nodeset
-from cumin.backends import BaseQuery, direct
+from cumin.backends import BaseQuery, BaseQueryAggregator, InvalidQueryError, direct
+from cumin.tests import get_grammar_fixture_lines
 
 
 def test_direct_query_class():
@@ -10,6 +17,14 @@ def test_direct_query_class():
     assert isinstance(query, BaseQuery)
 
 
+def _get_hosts_elements(stack_element):
+    """Return the stack elements with hosts in the given stack."""
+    if stack_element.hosts is not None:
+        return [stack_element]
+
+    return [element for child in stack_element.children for element in _get_hosts_elements(child)]
+
+
 class TestDirectQuery:
     """Direct backend query test class."""
 
@@ -22,6 +37,119 @@ class TestDirectQuery:
         assert isinstance(self.query, BaseQuery)
         assert self.query.config == {}
 
+    @pytest.mark.parametrize('query_string, expected', (
+        ('host[1-5] and (host1 and host2)', ''),
+        ('host[1-5] or (host1 and host2)', 'host[1-5]'),
+        ('host[1-5] and not (host1 and host2)', 'host[1-5]'),
+        ('host[1-5] xor (host1 and host2)', 'host[1-5]'),
+    ))
+    def test_execute_empty_operand(self, query_string, expected):
+        """Calling execute() with empty subgroups should return the same hosts of the NodeSet operations."""
+        assert self.query.execute(query_string) == nodeset(expected)
+
+    def test_execute_deep_stack(self):
+        """Calling _execute() should not recurse while traversing very deep stacks."""
+        self.query.stack = self.query._get_stack_element()  # pylint: disable=protected-access
+        self.query.stack_pointer = self.query.stack
+        for _ in range(5000):
+            self.query._open_subgroup()  # pylint: disable=protected-access
+
+        self.query._add_hosts(nodeset('host1'), None)  # pylint: disable=protected-access
+        assert self.query._execute() == nodeset('host1')  # pylint: disable=protected-access
+
+    def test_build_stack_no_parent(self):
+        """Building a query with subgroups should not leave references from the stack elements to their parent."""
+        self.query._build('host1 or (host2 and (host3))')  # pylint: disable=protected-access
+        assert self.query.stack_parents == []
+        assert self.query.stack_pointer is self.query.stack
+        subgroup = self.query.stack.children[1]
+        assert not hasattr(subgroup, 'parent')
+        assert subgroup.bool == 'or'
+        assert subgroup.children[1].hosts == nodeset('host3')
+
+    def test_execute_stack_not_modified(self):
+        """Calling execute() should not modify the hosts in the stack, as it can be reused."""
+        assert self.query.execute('(host1 xor host2) and host2') == nodeset('host2')
+        assert self.query.stack.children[0].children[0].hosts == nodeset('host1')
+        assert self.query.execute('host1 xor host2') == nodeset('host[1-2]')
+        assert self.query.stack.children[0].hosts == nodeset('host1')
+
+    @mock.patch('cumin.backends.nodeset', wraps=nodeset)
+    def test_execute_no_subgroup_nodeset(self, mocked_nodeset):
+        """Calling execute() should not create a new NodeSet for each subgroup to aggregate its results."""
+        assert self.query.execute('host1 or (host2 and (host[2-3] xor host3))') == nodeset('host[1-2]')
+        assert mocked_nodeset.call_count == 1
+
+    @pytest.mark.parametrize('query_string, expected, elements', (
+        ('host1 or host2 or host3', 'host[1-3]', 1),
+        ('host3 or host[1-5]!host3', 'host[1-5]', 1),
+        ('host[1-2] and host2 or host3 OR host4', 'host[2-4]', 3),
+        ('host1 or (host2 or host3) or host4', 'host[1-4]', 3),
+        ('host1 xor host2 or host1', 'host[1-2]', 3),
+    ))
+    def test_execute_fuse_or(self, query_string, expected, elements):
+        """Calling execute() should fuse the chains of hosts in logical OR into a single stack element."""
+        assert self.query.execute(query_string) == nodeset(expected)
+        assert len(_get_hosts_elements(self.query.stack)) == elements
+
+    @pytest.mark.parametrize('query_string', (
+        'host1!host1 or host2',
+        'host1!host1 or host2 or host3',
+        '(host1!host1) or host2',
+        'host1!host1 and host2',
+        'host1 and host2 or host3',
+        'host4 and (host1!host1 or host2)',
+    ))
+    def test_execute_fuse_or_empty_first(self, query_string):
+        """Calling execute() should raise InvalidQueryError if the first hosts are empty also when fusing them."""
+        with pytest.raises(InvalidQueryError, match="Unexpected boolean operator '(or|and)' with hosts ''"):
+            self.query.execute(query_string)
+
+    @pytest.mark.parametrize('query_string, expected', (
+        ('host1', 'host1'),
+        ('((host1))', 'host1'),
+        ('host1 and not ((host1 xor host2))', ''),
+        ('(host[1-3] and not (host2)) or host5', 'host[1,3,5]'),
+    ))
+    def test_build_flatten_stack(self, query_string, expected):
+        """Calling _build() should collapse the subgroups with a single child keeping their boolean operator."""
+        assert self.query.execute(query_string) == nodeset(expected)
+        elements = [self.query.stack]
+        while elements:
+            element = elements.pop()
+            assert len(element.children) != 1
+            elements.extend(element.children)
+
+    def test_stack_element_dict_access(self):
+        """The stack elements should allow to access their attributes also as dictionary keys."""
+        element = self.query._get_stack_element()  # pylint: disable=protected-access
+        element['bool'] = 'or'
+        assert element.bool == 'or'
+        assert element['children'] is element.children
+        assert element['hosts'] is None
+        with pytest.raises(KeyError, match='parent'):
+            element['parent']  # pylint: disable=pointless-statement
+        with pytest.raises(KeyError, match='parent'):
+            element['parent'] = None
+
+    def test_execute_no_trace(self):
+        """Calling execute() should not log each aggregation if the trace logging level is not enabled."""
+        with mock.patch.object(self.query, 'logger') as mocked_logger:
+            mocked_logger.isEnabledFor.return_value = False
+            assert self.query.execute('host1 or (host2 and host[2-3])') == nodeset('host[1-2]')
+
+        assert mocked_logger.isEnabledFor.called
+        assert not [call for call in mocked_logger.trace.call_args_list if call[0][0].startswith('Aggregating')]
+
+    def test_logger(self):
+        """All the instances of DirectQuery should share the same logger, named after the class."""
+        assert self.query.logger.name == 'cumin.backends.direct.DirectQuery'
+        assert direct.DirectQuery({}).logger is self.query.logger
+
+    def test_no_instance_dict(self):
+        """An instance of DirectQuery should not have a per-instance __dict__."""
+        assert not hasattr(self.query, '__dict__')
+
     def test_execute(self):
         """Calling execute() should return the list of hosts."""
         assert self.query.execute('host1 or host2') == nodeset('host[1-2]')
@@ -30,3 +158,71 @@ class TestDirectQuery:
         assert self.query.execute('host[1-5] xor host[3-7]') == nodeset('host[1-2,6-7]')
         assert self.query.execute('host1 or (host[10-20] and not host15)') == nodeset('host[1,10-14,16-20]')
         assert self.query.execute('(host1 or host[2-3]) and not (host[3-9] or host2)') == nodeset('host1')
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('direct_valid.txt') + [
+    'host1 AND NOT host2', 'host1 or(host2)', '(host1)xor host2', 'host1 and nothost', 'andrew or orca'])
+def test_parser_valid(query_string):
+    """The hand-written parser should build the same results of the pyparsing grammar for valid queries."""
+    query = direct.DirectQuery({})
+    BaseQueryAggregator._build(query, query_string)  # pylint: disable=protected-access
+    expected = query._execute()  # pylint: disable=protected-access
+    assert query.execute(query_string) == expected
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('direct_invalid.txt') + [
+    '', 'host1 and', 'host1 and not', '(host1', 'host1)', 'and-host', 'or.domain', '!host1 and', 'OR-host',
+    'host\u212a'])
+def test_parser_invalid(query_string):
+    """The hand-written parser should raise ParseException for invalid queries, like the pyparsing grammar."""
+    with pytest.raises(ParseException):
+        direct.DirectQuery({}).execute(query_string)
+
+
+@pytest.mark.parametrize('query_string, expected', (
+    ('host1.domain', 'host1.domain'),
+    (' host[1-3],host5!host2 ', 'host[1,3,5]'),
+    ('andrew', 'andrew'),
+    ('ORca', 'ORca'),
+))
+@mock.patch('cumin.backends.direct.BooleanQueryParser')
+def test_single_hosts_no_parser(mocked_parser, query_string, expected):
+    """A query with a single hosts item should not need the parser."""
+    assert direct.DirectQuery({}).execute(query_string) == nodeset(expected)
+    assert not mocked_parser.called
+
+
+@mock.patch('cumin.backends.direct.DirectQuery._stack_cache', new_callable=OrderedDict)
+def test_stack_cache(mocked_cache):
+    """The stack of an already built query should be reused, also by other instances."""
+    query_string = 'host1 or (host[2-5] and not host3)'
+    query = direct.DirectQuery({})
+    assert query.execute(query_string) == nodeset('host[1-2,4-5]')
+    assert list(mocked_cache.keys()) == [query_string]
+    with mock.patch('cumin.backends.direct.BooleanQueryParser') as mocked_parser:
+        assert direct.DirectQuery({}).execute(' ' + query_string) == nodeset('host[1-2,4-5]')
+        assert direct.DirectQuery({}).execute(query_string) == nodeset('host[1-2,4-5]')
+
+    assert not mocked_parser.called
+
+
+@mock.patch('cumin.backends.direct.STACK_CACHE_SIZE', 2)
+@mock.patch('cumin.backends.direct.DirectQuery._stack_cache', new_callable=OrderedDict)
+def test_stack_cache_size(mocked_cache):
+    """The least recently used stack should be discarded when the cache is full."""
+    query = direct.DirectQuery({})
+    for query_string in ('host1', 'host2', 'host1', 'host3'):
+        query.execute(query_string)
+
+    assert list(mocked_cache.keys()) == ['host1', 'host3']
+
+
+def test_hosts_cache():
+    """The same hosts string should be expanded only once also across different queries, without sharing the NodeSet."""
+    direct._expand_hosts.cache_clear()  # pylint: disable=protected-access
+    query = direct.DirectQuery({})
+    assert query.execute('host[1-5]!host3 and host[4-9]') == nodeset('host[4-5]')
+    assert query.execute('host[1-5]!host3 or host[4-9]') == nodeset('host[1-2,4-9]')
+    info = direct._expand_hosts.cache_info()  # pylint: disable=protected-access
+    assert (info.misses, info.hits) == (2, 2)
+    assert direct._expand_hosts('host[1-5]!host3') == nodeset('host[1-2,4-5]')  # pylint: disable=protected-access
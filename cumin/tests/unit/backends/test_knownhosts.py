@@ -1,13 +1,18 @@
 """Known hosts backend tests."""
+import ipaddress
 import os
 
+from unittest import mock
+
 import pytest
 
 from ClusterShell.NodeSet import NodeSet, RESOLVER_NOGROUP
+from pyparsing import ParseException
 
-from cumin.backends import BaseQuery
+from cumin.backends import BaseQuery, BaseQueryAggregator
+from cumin.backends import knownhosts
 from cumin.backends.knownhosts import KnownHostsLineError, KnownHostsQuery, KnownHostsSkippedLineError, query_class
-from cumin.tests import get_fixture_path
+from cumin.tests import get_fixture_path, get_grammar_fixture_lines
 
 
 def test_knownhosts_query_class():
@@ -16,6 +21,79 @@ def test_knownhosts_query_class():
     assert isinstance(query, BaseQuery)
 
 
+def _get_query():
+    """Return an instance of KnownHostsQuery with the known hosts from the fixtures."""
+    return KnownHostsQuery({'knownhosts': {'files': [
+        get_fixture_path(os.path.join('backends', 'knownhosts.txt')),
+        get_fixture_path(os.path.join('backends', 'knownhosts_man.txt')),
+    ]}})
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('knownhosts_valid.txt') + [
+    'host1.domain AND NOT host2.domain', 'host* or(cvs*)', '(host1*)xor host[1-5]*', 'host1.domain and nothost',
+    'andrew', 'orca*'])
+def test_parser_valid(query_string):
+    """The hand-written parser should build the same results of the pyparsing grammar for valid queries."""
+    query = _get_query()
+    query.execute('host1.domain')  # Load the known hosts
+    BaseQueryAggregator._build(query, query_string)  # pylint: disable=protected-access
+    expected = query._execute()  # pylint: disable=protected-access
+    assert query.execute(query_string) == expected
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('knownhosts_invalid.txt') + [
+    '', 'host1 and', '(host1', 'host1)', 'and-host', 'OR-host', 'host\u212a'])
+def test_parser_invalid(query_string):
+    """The hand-written parser should raise ParseException for invalid queries, like the pyparsing grammar."""
+    with pytest.raises(ParseException):
+        _get_query().execute(query_string)
+
+
+@pytest.mark.parametrize('query_string, expected', (
+    ('host1.domain', 'host1.domain'),
+    (' host[1-5].domain!host4.domain ', 'host[1,5].domain'),
+    ('*', 'closenet,cvs.example.net,host[1,4-5,7-8,13-14].domain'),
+    ('ORca', ''),
+))
+@mock.patch('cumin.backends.knownhosts.BooleanQueryParser')
+def test_single_hosts_no_parser(mocked_parser, query_string, expected):
+    """A query with a single hosts item should not need the parser."""
+    assert _get_query().execute(query_string) == NodeSet(expected, resolver=RESOLVER_NOGROUP)
+    assert not mocked_parser.called
+
+
+@mock.patch('cumin.backends.knownhosts._KNOWN_HOSTS_CACHE', {})
+@mock.patch.object(KnownHostsQuery, '_load_known_hosts', autospec=True,
+                   side_effect=KnownHostsQuery._load_known_hosts)  # pylint: disable=protected-access
+def test_known_hosts_cache(mocked_load_known_hosts):
+    """The known hosts files should be loaded only once by all the instances, unless they are modified."""
+    expected = NodeSet('host[1,4].domain', resolver=RESOLVER_NOGROUP)
+    assert _get_query().execute('host1.domain or host4.domain') == expected
+    assert _get_query().execute('host1.domain or host4.domain') == expected
+    assert mocked_load_known_hosts.call_count == 1
+
+
+@mock.patch('cumin.backends.knownhosts._KNOWN_HOSTS_CACHE', {})
+def test_known_hosts_cache_frozen():
+    """The known hosts shared by the instances should not be modifiable."""
+    query = _get_query()
+    query.execute('host1.domain')
+    assert isinstance(query.known_hosts, frozenset)
+    assert _get_query().execute('host1.domain') == NodeSet('host1.domain', resolver=RESOLVER_NOGROUP)
+
+
+@mock.patch('cumin.backends.knownhosts._KNOWN_HOSTS_CACHE', {})
+def test_known_hosts_cache_modified(tmp_path):
+    """The known hosts files should be loaded again if modified."""
+    known_hosts = tmp_path / 'known_hosts'
+    known_hosts.write_text('host1.domain ssh-rsa AAAA\n')
+    config = {'knownhosts': {'files': [str(known_hosts)]}}
+    assert KnownHostsQuery(config).execute('host*') == NodeSet('host1.domain', resolver=RESOLVER_NOGROUP)
+
+    known_hosts.write_text('host1.domain ssh-rsa AAAA\nhost2.domain ssh-rsa AAAA\n')
+    assert KnownHostsQuery(config).execute('host*') == NodeSet('host[1-2].domain', resolver=RESOLVER_NOGROUP)
+
+
 class TestKnownhostsQuery:
     """Knownhosts backend query test class."""
 
@@ -50,6 +128,15 @@ class TestKnownhostsQuery:
         expected = NodeSet('host[1,4].domain', resolver=RESOLVER_NOGROUP)
         assert self.query.execute('host1.domain or host4.domain') == expected
 
+    def test_execute_no_all_hosts_expansion(self):
+        """Calling execute() should filter the selected hosts without expanding all the known hosts."""
+        self.query.execute('host1.domain')  # Load the known hosts
+        with mock.patch.object(self.query.resolver, 'all_nodes', wraps=self.query.resolver.all_nodes) as mocked:
+            assert self.query.execute('host1.domain or nohost1.domain') == NodeSet('host1.domain',
+                                                                                   resolver=RESOLVER_NOGROUP)
+
+        assert not mocked.called
+
     def test_execute_and(self):
         """Calling execute() with two hosts in 'and' should return no hosts."""
         assert self.query.execute('host1.domain and host2.domain') == self.no_hosts
@@ -190,3 +277,45 @@ def test_parse_line_hosts_ips():
     assert KnownHostsQuery.parse_line_hosts('host1,127.0.1.1') == ({'host1'}, {'127.0.1.1'})
     assert KnownHostsQuery.parse_line_hosts('host1,fe80::1') == ({'host1'}, {'fe80::1'})
     assert KnownHostsQuery.parse_line_hosts('host1,127.0.1.1,fe80::1') == ({'host1'}, {'127.0.1.1', 'fe80::1'})
+
+
+def test_parse_line_hosts_not_ips():
+    """Line hosts that look like IPs but are not valid IPs should be considered hostnames."""
+    assert KnownHostsQuery.parse_line_hosts('1234,127.0.1,host:1,cafe.bad') == (
+        {'1234', '127.0.1', 'host:1', 'cafe.bad'}, set())
+
+
+def test_parse_line_hosts_scoped_ips():
+    """Line hosts with IPv6 with a scope ID should skip them."""
+    assert KnownHostsQuery.parse_line_hosts('host1,fe80::1%eth0,[fe80::2%eth0]:22') == (
+        {'host1'}, {'fe80::1%eth0', 'fe80::2%eth0'})
+
+
+@pytest.mark.parametrize('address', (
+    '10.0.0.1', '0.0.0.0', '010.0.0.1', '10.0.0', '10.0.0.1.', '256.0.0.1', '10.0.0.1%eth0', '::', '::1',
+    'fe80::1%eth0', 'fe80::1%', 'fe80::1%eth0%1', '::ffff:10.0.0.1', '2620:0:861::1', '1::2::3', '1:2:3:4:5:6:7:8:9',
+    'cafe', 'a.b',
+))
+def test_is_ip_address(address):
+    """It should detect the IP addresses like the ipaddress module does."""
+    try:
+        ipaddress.ip_address(address)
+        expected = True
+    except ValueError:
+        expected = False
+
+    assert knownhosts._is_ip_address(address) is expected  # pylint: disable=protected-access
+
+
+@pytest.mark.parametrize('line', (
+    'host1,host2 ssh-rsa AAAA',
+    '  host1,host2\tssh-rsa AAAA comment',
+    '@cert-authority host1,host2 ssh-rsa AAAA',
+))
+def test_load_known_hosts_lines(tmp_path, line):
+    """Loading the known hosts files should extract the same hosts of parse_known_hosts_line()."""
+    known_hosts = tmp_path / 'known_hosts'
+    known_hosts.write_text(f'{line}\nhost3 ssh-rsa\n# comment\n|1|hashed ssh-rsa AAAA\n')
+    query = KnownHostsQuery({'knownhosts': {'files': [str(known_hosts)]}})
+    query._load_known_hosts()  # pylint: disable=protected-access
+    assert query.known_hosts == KnownHostsQuery.parse_known_hosts_line(line)[0] == {'host1', 'host2'}
@@ -1,13 +1,25 @@
 """OpenStack backend tests."""
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
+import pytest
+
 from cumin import nodeset
 from cumin.backends import BaseQuery, openstack
 
 
 Project = namedtuple('Project', ['name'])
-Server = namedtuple('Server', ['name'])
+Server = namedtuple('Server', ['name', 'id'])
+
+
+def _get_servers_pages(*pages):
+    """Return a side effect for the Nova servers list that returns the servers with the given names in pages."""
+    servers = {None: [Server(name, f'{name}-id') for name in pages[0]]}
+    for previous, page in zip(pages, pages[1:]):
+        servers[f'{previous[-1]}-id'] = [Server(name, f'{name}-id') for name in page]
+
+    return lambda **kwargs: servers.get(kwargs['marker'], [])
 
 
 def test_openstack_query_class():
@@ -58,24 +70,60 @@ class TestOpenStackQuery:
     def test_execute_all(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """Calling execute() with a query that select all hosts should return the list of all hosts."""
         keystone_client.return_value.projects.list.return_value = [Project('project1'), Project('project2')]
-        nova_client.return_value.servers.list.side_effect = [
-            [Server('host1'), Server('host2')], [Server('host1'), Server('host2')]]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
 
         hosts = self.query.execute('*')
         assert hosts == nodeset('host[1-2].project[1-2]')
 
-        assert keystone_identity.call_count == 3
+        assert keystone_identity.call_count == 1
         assert keystone_session.call_count == 3
         keystone_client.assert_called_once_with(session=keystone_session(), timeout=10)
         assert nova_client.call_args_list == [
             mock.call('2', endpoint_type='public', session=keystone_session(), timeout=10),
             mock.call('2', endpoint_type='public', session=keystone_session(), timeout=10)]
         assert nova_client().servers.list.call_args_list == [
-            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'})] * 2
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'}, marker=None, limit=1000),
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'}, marker='host2-id', limit=1000)] * 2
+
+    @mock.patch('cumin.backends.openstack.keystone_identity.Token')
+    def test_execute_all_rescope_token(self, keystone_token, keystone_identity, keystone_session, keystone_client,
+                                       nova_client):
+        """Calling execute() with a query that select all hosts should authenticate only once and rescope the token."""
+        keystone_client.return_value.projects.list.return_value = [Project('project1'), Project('project2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1'])
+
+        hosts = self.query.execute('*')
+        assert hosts == nodeset('host1.project[1-2]')
+
+        keystone_identity.assert_called_once_with(
+            auth_url='http://localhost:5000/v3', username='username', password='password', project_name=None,
+            user_domain_id='default', project_domain_id='default')
+        assert sorted(keystone_token.call_args_list, key=lambda call: call[1]['project_name']) == [
+            mock.call(auth_url='http://localhost:5000/v3', token=keystone_session.return_value.get_token.return_value,
+                      project_name=project, project_domain_id='default') for project in ('project1', 'project2')]
+        assert keystone_session.call_args_list[1:] == [
+            mock.call(auth=keystone_token.return_value, session=keystone_session.return_value.session)] * 2
+
+    @pytest.mark.parametrize('workers, parallel', ((1, False), (2, True), (None, True)))
+    def test_execute_all_workers(self, keystone_identity, keystone_session, keystone_client, nova_client, workers,
+                                 parallel):
+        """Calling execute() with a query that select all hosts should query the projects in parallel if allowed."""
+        # pylint: disable=unused-argument
+        if workers is not None:
+            self.config['openstack']['workers'] = workers
+        query = openstack.OpenStackQuery(self.config)
+        keystone_client.return_value.projects.list.return_value = [Project('project1'), Project('project2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1'])
+
+        with mock.patch('cumin.backends.openstack.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as mocked_executor:
+            hosts = query.execute('*')
+
+        assert hosts == nodeset('host1.project[1-2]')
+        assert mocked_executor.called is parallel
 
     def test_execute_project(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """Calling execute() with a query that select all hosts in a project should return the list of hosts."""
-        nova_client.return_value.servers.list.return_value = [Server('host1'), Server('host2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
 
         hosts = self.query.execute('project:project1')
         assert hosts == nodeset('host[1-2].project1')
@@ -84,11 +132,26 @@ class TestOpenStackQuery:
         assert keystone_session.call_count == 1
         keystone_client.assert_not_called()
         nova_client.assert_called_once_with('2', endpoint_type='public', session=keystone_session(), timeout=10)
-        nova_client().servers.list.assert_called_once_with(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'})
+        assert nova_client().servers.list.call_args_list == [
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'}, marker=None, limit=1000),
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE'}, marker='host2-id', limit=1000)]
+
+    def test_execute_project_pages(self, keystone_identity, keystone_session, keystone_client, nova_client):
+        """Calling execute() should get the hosts one page at a time, with the configured page size."""
+        # pylint: disable=unused-argument
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'], ['host3'])
+        self.config['openstack']['page_size'] = 2
+        query = openstack.OpenStackQuery(self.config)
+
+        hosts = query.execute('project:project1')
+        assert hosts == nodeset('host[1-3].project1')
+        calls = nova_client().servers.list.call_args_list
+        assert [call[1]['marker'] for call in calls] == [None, 'host2-id', 'host3-id']
+        assert {call[1]['limit'] for call in calls} == {2}
 
     def test_execute_project_name(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """Calling execute() with a query that select hosts matching a name in a project should return only those."""
-        nova_client.return_value.servers.list.return_value = [Server('host1'), Server('host2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
 
         hosts = self.query.execute('project:project1 name:host')
         assert hosts == nodeset('host[1-2].project1')
@@ -97,12 +160,14 @@ class TestOpenStackQuery:
         assert keystone_session.call_count == 1
         keystone_client.assert_not_called()
         nova_client.assert_called_once_with('2', endpoint_type='public', session=keystone_session(), timeout=10)
-        nova_client().servers.list.assert_called_once_with(
-            search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE', 'name': 'host'})
+        assert nova_client().servers.list.call_args_list == [
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE', 'name': 'host'}, marker=None, limit=1000),
+            mock.call(search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE', 'name': 'host'}, marker='host2-id',
+                      limit=1000)]
 
     def test_execute_project_domain(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """When the domain suffix is configured, it should append it to all hosts."""
-        nova_client.return_value.servers.list.return_value = [Server('host1'), Server('host2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
         self.config['openstack']['domain_suffix'] = 'servers.local'
         query = openstack.OpenStackQuery(self.config)
 
@@ -115,7 +180,7 @@ class TestOpenStackQuery:
 
     def test_execute_project_dot_domain(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """When the domain suffix is configured with a dot, it should append it to all hosts without the dot."""
-        nova_client.return_value.servers.list.return_value = [Server('host1'), Server('host2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
         self.config['openstack']['domain_suffix'] = '.servers.local'
         query = openstack.OpenStackQuery(self.config)
 
@@ -128,7 +193,7 @@ class TestOpenStackQuery:
 
     def test_execute_query_params(self, keystone_identity, keystone_session, keystone_client, nova_client):
         """When the query_params are set, they must be loaded automatically."""
-        nova_client.return_value.servers.list.return_value = [Server('host1'), Server('host2')]
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1', 'host2'])
         self.config['openstack']['query_params'] = {'project': 'project1'}
         query = openstack.OpenStackQuery(self.config)
 
@@ -138,3 +203,17 @@ class TestOpenStackQuery:
         assert keystone_identity.call_count == 1
         assert keystone_session.call_count == 1
         keystone_client.assert_not_called()
+
+    @mock.patch('pyparsing.ParseResults.asDict')
+    def test_execute_quoted_value_no_trace(self, mocked_as_dict, keystone_identity, keystone_session, keystone_client,
+                                           nova_client):
+        """Calling execute() should pass the unquoted values without converting each token if not tracing."""
+        # pylint: disable=unused-argument
+        nova_client.return_value.servers.list.side_effect = _get_servers_pages(['host1'])
+
+        hosts = self.query.execute('project:project1 name:"host1 host2"')
+        assert hosts == nodeset('host1.project1')
+
+        assert nova_client().servers.list.call_args_list[0] == mock.call(
+            search_opts={'vm_state': 'ACTIVE', 'status': 'ACTIVE', 'name': 'host1 host2'}, marker=None, limit=1000)
+        assert not mocked_as_dict.called
@@ -1,12 +1,17 @@
 """PuppetDB backend tests."""
+from collections import OrderedDict
 from unittest import mock
 
+import pyparsing as pp
 import pytest
+import requests
+import urllib3
 
 from requests.exceptions import HTTPError
 
 from cumin import nodeset
 from cumin.backends import BaseQuery, InvalidQueryError, puppetdb
+from cumin.tests import get_grammar_fixture_lines
 
 
 def test_puppetdb_query_class():
@@ -49,6 +54,16 @@ class TestPuppetDBQueryV4:
         assert isinstance(self.query, BaseQuery)
         assert self.query.url == 'https://localhost:443/pdb/query/v4/'
 
+    def test_no_instance_dict(self):
+        """An instance of PuppetDBQuery should not have a per-instance __dict__."""
+        assert not hasattr(self.query, '__dict__')
+
+    @mock.patch('urllib3.disable_warnings')
+    def test_urllib3_disable_warnings(self, mocked_disable_warnings):
+        """The configured urllib3 warnings should be disabled, importing urllib3 only if needed."""
+        puppetdb.PuppetDBQuery({'puppetdb': {'urllib3_disable_warnings': ['InsecureRequestWarning']}})
+        mocked_disable_warnings.assert_called_once_with(category=urllib3.exceptions.InsecureRequestWarning)
+
     def test_endpoint_getter(self):
         """Access to endpoint property should return nodes by default."""
         assert self.query.endpoint == 'nodes'
@@ -245,13 +260,26 @@ class TestPuppetDBQueryBuildV4:
             '["or", ["=", "certname", "host"]]'),
         (  # Multiple hosts
             'host[1-2]',
-            '["or", ["=", "certname", "host1"], ["=", "certname", "host2"]]'),
+            '["or", ["in", "certname", ["array", ["host1", "host2"]]]]'),
         (  # Negated query
             'not host[1-2]',
-            '["not", ["or", ["=", "certname", "host1"], ["=", "certname", "host2"]]]'),
+            '["not", ["or", ["in", "certname", ["array", ["host1", "host2"]]]]]'),
         (  # Globbing hosts
             'host1*.domain',
             r'["or", ["~", "certname", "^host1.*\\.domain$"]]'),
+        (  # Mixed globbing and multiple hosts
+            'host1*.domain,host[2-3].domain',
+            r'["or", ["in", "certname", ["array", ["host2.domain", "host3.domain"]]], '
+            r'["~", "certname", "^host1.*\\.domain$"]]'),
+        (  # Mixed globbing and single host
+            'host1*.domain,host2.domain',
+            r'["or", ["=", "certname", "host2.domain"], ["~", "certname", "^host1.*\\.domain$"]]'),
+        (  # Multiple globbing hosts
+            'host1*.domain,host2*',
+            r'["or", ["~", "certname", "^(host2.*|host1.*\\.domain)$"]]'),
+        (  # Mixed multiple globbing and multiple hosts
+            'host[1-2]*,host[3-4]',
+            r'["or", ["in", "certname", ["array", ["host3", "host4"]]], ["~", "certname", "^(host1.*|host2.*)$"]]'),
     ))
     def test_add_hosts(self, mocked_api_call, query, expected):
         """A host query should add the proper query token to the current_group."""
@@ -282,6 +310,77 @@ class TestPuppetDBQueryBuildV4:
         assert self.query.current_group['bool'] == operator
         mocked_api_call.assert_called_with(expected)
 
+    def test_build_no_parent(self, mocked_api_call):
+        """Building a query with subgroups should not leave references from the groups to their parent."""
+        # pylint: disable=unused-argument
+        self.query.execute('host1 or (host2 and (host3 or host4))')
+        assert self.query.group_parents == []
+        assert self.query.current_group is self.query.grouped_tokens
+        subgroup = self.query.grouped_tokens['tokens'][1]
+        assert 'parent' not in subgroup
+        assert subgroup['bool'] == 'and'
+        assert subgroup['tokens'][1]['bool'] == 'or'
+
+    def test_get_query_string_deep(self, mocked_api_call):
+        """Building the query string should not recurse while traversing very deep grouped tokens."""
+        # pylint: disable=unused-argument
+        group = self.query._get_grouped_tokens()  # pylint: disable=protected-access
+        group['tokens'].append('["=", "certname", "host1"]')
+        for _ in range(5000):
+            group = {'bool': 'and', 'tokens': [group, '["=", "certname", "host2"]']}
+
+        query = self.query._get_query_string(group)  # pylint: disable=protected-access
+        assert query.startswith('["and", ' * 5000 + '["=", "certname", "host1"], ["=", "certname", "host2"]], ')
+        assert query.endswith(']')
+
+    @pytest.mark.parametrize('query', ('f:key <= 5 OR host1', 'F:key<=5 Or host1', 'F:key <= 5 or host1'))
+    def test_case_insensitive(self, mocked_api_call, query):
+        """The categories and the boolean operators should be matched case-insensitively and normalized."""
+        self.query.execute(query)
+        mocked_api_call.assert_called_with(
+            '["extract", ["certname"], ["or", ["<=", ["fact", "key"], 5], ["or", ["=", "certname", "host1"]]], '
+            '["group_by", "certname"]]')
+        assert self.query.current_group['bool'] == 'or'
+
+    @pytest.mark.parametrize('query', ('andrew', 'orhost', 'or-host'))
+    def test_boolean_prefixed_hosts(self, mocked_api_call, query):
+        """Hostnames starting with a boolean operator should be matched as hosts where allowed by the keywords rules."""
+        if query == 'or-host':
+            with pytest.raises(pp.ParseException):
+                self.query.execute(query)
+        else:
+            self.query.execute(query)
+            mocked_api_call.assert_called_with(
+                f'["extract", ["certname"], ["or", ["=", "certname", "{query}"]], ["group_by", "certname"]]')
+
+    @mock.patch('pyparsing.ParseResults.asDict')
+    def test_parse_token_no_as_dict(self, mocked_as_dict, mocked_api_call):
+        """Parsing the tokens should access their named results directly, without converting them."""
+        self.query.execute('(host10 or not F:key = "quoted value") and F:other >= 5')
+        mocked_api_call.assert_called_with(
+            '["extract", ["certname"], ["and", ["or", ["or", ["=", "certname", "host10"]], '
+            '["not", ["=", ["fact", "key"], "quoted value"]]], [">=", ["fact", "other"], 5]], '
+            '["group_by", "certname"]]')
+        assert not mocked_as_dict.called
+
+    def test_endpoint_set_once(self, mocked_api_call):
+        """The endpoint should be set only by the first category token, the following ones already match it."""
+        endpoint = puppetdb.PuppetDBQuery.endpoint
+        mocked_setter = mock.Mock(wraps=endpoint.fset)
+        with mock.patch.object(puppetdb.PuppetDBQuery, 'endpoint', endpoint.setter(mocked_setter)):
+            self.query.execute('F:key1 = value1 and F:key2 = value2 and not F:key3 = value3')
+
+        assert mocked_api_call.called
+        mocked_setter.assert_called_once_with(self.query, 'nodes')
+        assert self.query.endpoint == 'nodes'
+
+    def test_mixed_endpoints(self, mocked_api_call):
+        """A query with categories of different endpoints should raise InvalidQueryError."""
+        with pytest.raises(InvalidQueryError, match='Mixed endpoints are not supported'):
+            self.query.execute('F:key = value and R:Class = MyClass')
+
+        assert not mocked_api_call.called
+
     def test_and_or(self, mocked_api_call):
         """A query with 'and' and 'or' in the same group should raise InvalidQueryError."""
         with pytest.raises(InvalidQueryError, match='boolean operator, current operator was'):
@@ -289,6 +388,70 @@ class TestPuppetDBQueryBuildV4:
             assert not mocked_api_call.called
 
 
+@mock.patch.object(puppetdb.PuppetDBQuery, '_api_call', return_value=[{'certname': 'host1'}])
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_query_cache(mocked_cache, mocked_api_call):
+    """The PuppetDB query of an already built query string should be reused, also by other instances."""
+    query_string = '(host1 or host2) and R:Class = MyClass'
+    expected = ('["extract", ["certname"], ["and", ["or", ["or", ["=", "certname", "host1"]], ["or", ["=", "certname", '
+                '"host2"]]], ["and", ["=", "type", "Class"], ["=", "title", "Myclass"]]], ["group_by", "certname"]]')
+    query = puppetdb.PuppetDBQuery({})
+    assert query.execute(query_string) == nodeset('host1')
+    assert list(mocked_cache.keys()) == [query_string]
+    with mock.patch.object(puppetdb.PuppetDBQuery, '_parse_token') as mocked_parse_token:
+        query = puppetdb.PuppetDBQuery({})
+        assert query.execute(' ' + query_string) == nodeset('host1')
+
+    assert not mocked_parse_token.called
+    assert query.endpoint == 'resources'
+    assert mocked_api_call.call_args_list == [mock.call(expected)] * 2
+
+
+@mock.patch.object(puppetdb.PuppetDBQuery, '_api_call', return_value=[])
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_query_cache_endpoint_reused_instance(mocked_cache, mocked_api_call):
+    """The cached endpoint should be the one set by the query itself, not the one left by a previous query."""
+    # pylint: disable=unused-argument
+    query = puppetdb.PuppetDBQuery({})
+    query.execute('R:Class = MyClass')
+    query.execute('host1')
+    assert mocked_cache['host1'][0] is None
+
+    query = puppetdb.PuppetDBQuery({})
+    query.execute('host1')
+    assert query.endpoint == 'nodes'
+
+    query = puppetdb.PuppetDBQuery({})
+    query.execute('F:key = value')
+    query.execute('host1')
+    assert query.endpoint == 'nodes'
+
+
+@mock.patch.object(puppetdb.PuppetDBQuery, '_api_call', return_value=[])
+@mock.patch('cumin.backends.puppetdb.QUERY_CACHE_SIZE', 2)
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_query_cache_size(mocked_cache, mocked_api_call):
+    """The least recently used PuppetDB query should be discarded when the cache is full."""
+    # pylint: disable=unused-argument
+    for query_string in ('host1', 'host2', 'host1', 'host3'):
+        puppetdb.PuppetDBQuery({}).execute(query_string)
+
+    assert list(mocked_cache.keys()) == ['host1', 'host3']
+
+
+@pytest.mark.parametrize('string, expected', (
+    ('class', 'Class'),
+    ('profile::some_name::Sub', 'Profile::Some_name::Sub'),
+    ('ROLE::NAME', 'Role::Name'),
+))
+def test_capwords(string, expected):
+    """The resource types and class titles should be capitalized like string.capwords and the result cached."""
+    puppetdb._capwords.cache_clear()  # pylint: disable=protected-access
+    assert puppetdb._capwords(string) == expected  # pylint: disable=protected-access
+    assert puppetdb._capwords(string) == expected  # pylint: disable=protected-access
+    assert puppetdb._capwords.cache_info().hits == 1  # pylint: disable=protected-access
+
+
 @pytest.mark.parametrize('query, expected', (
     ('nodes_host[1-2]', 'nodes_host[1-2]'),  # Nodes
     ('R:Class = value', 'resources_host[1-2]'),  # Resources
@@ -303,6 +466,18 @@ def test_endpoints(query_requests, query, expected):
     assert query_requests[1].call_count == 1
 
 
+def test_session_shared(query_requests):
+    """Calling execute() from different instances should reuse the same requests session."""
+    session = puppetdb.PuppetDBQuery._get_session()  # pylint: disable=protected-access
+    assert isinstance(session, requests.Session)
+    with mock.patch.object(session, 'post', wraps=session.post) as mocked_post:
+        assert query_requests[0].execute('nodes_host1 or nodes_host2') == nodeset('nodes_host[1-2]')
+        assert puppetdb.PuppetDBQuery({}).execute('nodes_host[1-2]') == nodeset('nodes_host[1-2]')
+
+    assert mocked_post.call_count == 2
+    assert puppetdb.PuppetDBQuery._get_session() is session  # pylint: disable=protected-access
+
+
 def test_error(query_requests):
     """Calling execute() if the request fails it should raise the requests exception."""
     with pytest.raises(HTTPError):
@@ -320,3 +495,60 @@ def test_complex_query(query_requests):
     hosts = query_requests[0].execute('(resources_host1 or resources_host2) and R:Class = MyClass')
     assert hosts == nodeset('resources_host[1-2]')
     assert query_requests[1].call_count == 1
+
+
+def _build_query_string(query_string, with_grammar):
+    """Build the query with the hand-written parser or with the pyparsing grammar and return its outcome."""
+    query = puppetdb.PuppetDBQuery({})
+    try:
+        if with_grammar:
+            query.grouped_tokens = query._get_grouped_tokens()  # pylint: disable=protected-access
+            query.current_group = query.grouped_tokens
+            BaseQuery._build(query, query_string)  # pylint: disable=protected-access
+            built = query._get_query_string(group=query.grouped_tokens)  # pylint: disable=protected-access
+        else:
+            query._build(query_string)  # pylint: disable=protected-access
+            built = query.puppetdb_query
+    except (pp.ParseException, InvalidQueryError) as e:
+        return type(e)
+
+    return built, query.endpoint
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('puppetdb_valid.txt') + [
+    'F:key = 0x1F', 'F:key = 017', 'F:key = 018', 'F:key = -1.5e3', 'F:key = .5', 'F:key = true', 'F:key = truex',
+    'F:key = 5abc', 'F:key="a""b"', "F:key = 'a\\'b'", 'f:key=value OR host1', 'F:a:b ~ ^a.*$', 'F:key = "unterminated',
+    'not"host 1"', 'NOT (host1 and not host2)', 'andrew or orca', 'not-host', '"host1" or \'host2\''])
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_parser_valid(mocked_cache, query_string):
+    """The hand-written parser should build the same query of the pyparsing grammar for valid queries."""
+    # pylint: disable=unused-argument
+    expected = _build_query_string(query_string, True)
+    assert expected is not pp.ParseException
+    assert _build_query_string(query_string, False) == expected
+
+
+@pytest.mark.parametrize('query_string', get_grammar_fixture_lines('puppetdb_invalid.txt') + [
+    '', 'host1 and', 'host1 and not', '(host1', 'host1)', 'and-host', 'not', 'not not host1', 'F:', 'F:key = (',
+    'F:key =', 'F : key', 'host1 F:key', '"a""'])
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_parser_invalid(mocked_cache, query_string):
+    """The hand-written parser should raise ParseException for invalid queries, like the pyparsing grammar."""
+    # pylint: disable=unused-argument
+    assert _build_query_string(query_string, True) is pp.ParseException
+    with pytest.raises(pp.ParseException):
+        puppetdb.PuppetDBQuery({}).execute(query_string)
+
+
+@mock.patch('cumin.backends.puppetdb.PuppetDBQuery._query_cache', new_callable=OrderedDict)
+def test_parser_no_grammar(mocked_cache):
+    """Building a query should not use the pyparsing grammar."""
+    # pylint: disable=unused-argument
+    with mock.patch('cumin.backends.puppetdb.PuppetDBQuery.grammar') as mocked_grammar:
+        query = puppetdb.PuppetDBQuery({})
+        query._build('F:key = value and (host1 or not host2)')  # pylint: disable=protected-access
+
+    expected = ('["and", ["=", ["fact", "key"], "value"], '
+                '["or", ["or", ["=", "certname", "host1"]], ["not", ["or", ["=", "certname", "host2"]]]]]')
+    assert query.puppetdb_query == expected
+    assert not mocked_grammar.parseString.called
@@ -1,11 +1,37 @@
 """Abstract query tests."""
 
+from unittest import mock
+
 import pytest
 
-from cumin.backends import BaseQuery
+from cumin.backends import BaseQuery, LazyGrammar
 
 
 def test_base_query_instantiation():
     """Class BaseQuery is not instantiable being an abstract class."""
     with pytest.raises(TypeError):
         BaseQuery({})  # pylint: disable=abstract-class-instantiated
+
+
+def test_lazy_grammar():
+    """The grammar should be built only once, when accessed for the first time from the class or an instance."""
+    factory = mock.Mock()
+
+    class Query:  # pylint: disable=too-few-public-methods
+        """Test class."""
+
+        grammar = LazyGrammar(factory)
+
+    assert not factory.called
+    grammar = Query().grammar
+    assert Query.grammar is grammar
+    assert Query().grammar is grammar
+    factory.assert_called_once_with()
+
+
+def test_base_query_subclass_logger():
+    """Each class derived from BaseQuery should get its own logger when defined, named after the class."""
+    class Query(BaseQuery):  # pylint: disable=abstract-method
+        """Test class."""
+
+    assert Query._logger.name == f'{__name__}.Query'  # pylint: disable=protected-access
@@ -30,6 +30,7 @@ def test_invalid_strings():
 
 
 # Built-in backends registration tests
+@mock.patch('cumin.grammar._INTERNAL_BACKEND_NAMES', None)
 @mock.patch('cumin.grammar.pkgutil.iter_modules')
 def test_duplicate_backend(mocked_iter_modules):
     """Trying to register a backend with the same key of another should raise CuminError."""
@@ -59,6 +60,7 @@ def test_backend_import_error_ext(mocked_import_modules):
         grammar.get_registered_backends(external=['cumin.tests.unit.backends.external.ok'])
 
 
+@mock.patch('cumin.grammar._INTERNAL_BACKEND_NAMES', None)
 @mock.patch('cumin.grammar.pkgutil.iter_modules')
 def test_import_error_backend(mocked_iter_modules):
     """Trying to register a backend that raises ImportError should silently skip it (missing optional dependencies)."""
@@ -69,6 +71,17 @@ def test_import_error_backend(mocked_iter_modules):
     assert sorted(backends.keys()) == ['D', 'P']
 
 
+@mock.patch('cumin.grammar._INTERNAL_BACKEND_NAMES', None)
+@mock.patch('cumin.grammar.pkgutil.iter_modules')
+def test_internal_backends_cached(mocked_iter_modules):
+    """The directory of the built-in backends should be walked only once."""
+    mocked_iter_modules.return_value = [(None, name, False) for name in ('direct', 'puppetdb')]
+    backends1 = grammar.get_registered_backends()
+    backends2 = grammar.get_registered_backends()
+    assert sorted(backends1.keys()) == sorted(backends2.keys()) == ['D', 'P']
+    assert mocked_iter_modules.call_count == 1
+
+
 # External backends registration tests
 def test_register_ok():
     """An external backend should be properly registered."""
@@ -99,5 +112,5 @@ def test_register_missing_class():
 
 def test_register_inheritance():
     """Registering an external backend with a query_class with the wrong inheritance should raise CuminError."""
-    with pytest.raises(CuminError, match='query_class module attribute is not a subclass'):
+    with pytest.raises(CuminError, match=r"'wrong_inheritance' in module .*: query_class module attribute is not a"):
         grammar.get_registered_backends(external=['cumin.tests.unit.backends.external.wrong_inheritance'])
@@ -24,6 +24,83 @@ def test_config_class_valid():
     assert config1 is config2
 
 
+def test_config_class_equivalent_paths(monkeypatch, tmp_path):
+    """Should return the same config object for equivalent paths to the same configuration file."""
+    (tmp_path / 'config.yaml').write_text('key: value\n')
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    config = cumin.Config(config=str(tmp_path / 'config.yaml'))
+    assert cumin.Config(config='~/config.yaml') is config
+    assert cumin.Config(config='config.yaml') is config
+    assert cumin.Config(config=tmp_path / 'config.yaml') is config
+
+
+def test_config_class_modified(tmp_path):
+    """Should load again the configuration if the file was modified since the last load."""
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_text('key: value1\n')
+    config1 = cumin.Config(config=str(config_file))
+    assert config1['key'] == 'value1'
+    config_file.write_text('key: value2\n')
+    mtime = config_file.stat().st_mtime_ns + 1_000_000_000
+    os.utime(config_file, ns=(mtime, mtime))
+    config2 = cumin.Config(config=str(config_file))
+    assert config2['key'] == 'value2'
+    assert config1 is not config2
+
+
+def test_config_class_aliases_modified(tmp_path):
+    """Should load again the configuration if the aliases file was modified, added or removed since the last load."""
+    config_file = str(tmp_path / 'config.yaml')
+    aliases_file = tmp_path / 'aliases.yaml'
+    (tmp_path / 'config.yaml').write_text('key: value\n')
+    config1 = cumin.Config(config=config_file)
+    assert 'aliases' not in config1
+
+    aliases_file.write_text('alias1: D{host1}\n')
+    config2 = cumin.Config(config=config_file)
+    assert config2['aliases'] == {'alias1': 'D{host1}'}
+
+    aliases_file.write_text('alias1: D{host2}\n')
+    mtime = aliases_file.stat().st_mtime_ns + 1_000_000_000
+    os.utime(aliases_file, ns=(mtime, mtime))
+    config3 = cumin.Config(config=config_file)
+    assert config3['aliases'] == {'alias1': 'D{host2}'}
+    assert cumin.Config(config=config_file) is config3
+
+    aliases_file.unlink()
+    assert 'aliases' not in cumin.Config(config=config_file)
+
+
+def test_config_class_modified_replaced(tmp_path):
+    """A configuration loaded again because modified should replace the cached one for the same path."""
+    config_file = tmp_path / 'config.yaml'
+    cumin.clear_config_cache()
+    for i in range(3):
+        config_file.write_text(f'key: value{i}\n')
+        mtime = config_file.stat().st_mtime_ns + (i + 1) * 1_000_000_000
+        os.utime(config_file, ns=(mtime, mtime))
+        assert cumin.Config(config=str(config_file))['key'] == f'value{i}'
+
+    assert list(cumin._CONFIG_CACHE) == [str(config_file)]  # pylint: disable=protected-access
+
+
+def test_clear_config_cache():
+    """Calling clear_config_cache() should force to load again the configuration on the next call."""
+    config_file = get_fixture_path(os.path.join('config', 'valid', 'config.yaml'))
+    config1 = cumin.Config(config=config_file)
+    cumin.clear_config_cache()
+    config2 = cumin.Config(config=config_file)
+    assert config1 == config2
+    assert config1 is not config2
+
+
+def test_get_config():
+    """Should return the same config object returned by the Config alias."""
+    config_file = get_fixture_path(os.path.join('config', 'valid', 'config.yaml'))
+    assert cumin.get_config(config=config_file) is cumin.Config(config=config_file)
+
+
 def test_config_class_empty():
     """An empty dictionary is returned if the configuration is empty."""
     config = cumin.Config(config=get_fixture_path(os.path.join('config', 'empty', 'config.yaml')))
@@ -48,6 +125,16 @@ def test_config_class_valid_with_aliases():
     assert config['aliases']['group1'] == 'D{host10[10-22].example.org}'
 
 
+def test_config_class_multidoc_aliases():
+    """Should merge the documents of a multi-document aliases file, in order."""
+    config = cumin.Config(config=get_fixture_path(os.path.join('config', 'valid_with_multidoc_aliases', 'config.yaml')))
+    assert config['aliases'] == {
+        'group1': 'D{host10[10-22].example.org}',
+        'group2': 'D{host30[10-22].example.org}',
+        'role1': 'P{R:Class = Role::Role1}',
+    }
+
+
 def test_config_class_empty_aliases():
     """The configuration is loaded also if the aliases file is empty."""
     config = cumin.Config(config=get_fixture_path(os.path.join('config', 'valid_with_empty_aliases', 'config.yaml')))
@@ -62,12 +149,38 @@ def test_config_class_invalid_aliases():
         cumin.Config(config=get_fixture_path(os.path.join('config', 'valid_with_invalid_aliases', 'config.yaml')))
 
 
+def test_config_class_aliases_not_a_file(tmp_path):
+    """The aliases are not loaded if the aliases path exists but is not a regular file."""
+    (tmp_path / 'config.yaml').write_text('key: value\n')
+    (tmp_path / 'aliases.yaml').mkdir()
+    config = cumin.Config(config=str(tmp_path / 'config.yaml'))
+    assert config == {'key': 'value'}
+
+
+@pytest.mark.parametrize('config_file, expected', (
+    ('/etc/cumin/config.yaml', '/etc/cumin/aliases.yaml'),
+    ('/config.yaml', '/aliases.yaml'),
+    ('cumin/config.yaml', 'cumin/aliases.yaml'),
+    ('config.yaml', 'aliases.yaml'),
+))
+def test_get_aliases_path(config_file, expected):
+    """Should return the path of the aliases file in the same directory of the configuration file."""
+    assert cumin._get_aliases_path(config_file) == expected  # pylint: disable=protected-access
+
+
 def test_parse_config_ok():
     """The configuration file is properly parsed and accessible."""
     config = cumin.parse_config(get_fixture_path(os.path.join('config', 'valid', 'config.yaml')))
     assert 'log_file' in config
 
 
+def test_parse_config_bom():
+    """The configuration file is properly parsed also if it starts with a UTF-8 BOM."""
+    config = cumin.parse_config(get_fixture_path(os.path.join('config', 'valid_with_bom', 'config.yaml')))
+    assert config['log_file'] == 'logs/cumin.log'
+    assert 'transport' in config
+
+
 def test_parse_config_non_existent():
     """A CuminError is raised if the configuration file is not available."""
     with pytest.raises(cumin.CuminError, match='Unable to read configuration file'):
@@ -80,6 +193,36 @@ def test_parse_config_invalid():
         cumin.parse_config(get_fixture_path(os.path.join('config', 'invalid', 'config.yaml')))
 
 
+def test_parse_config_truncated():
+    """A CuminError is raised also for YAML errors that are not parser errors, like a truncated file."""
+    with pytest.raises(cumin.CuminError, match='Unable to parse configuration file'):
+        cumin.parse_config(get_fixture_path(os.path.join('config', 'truncated', 'config.yaml')))
+
+
+def test_parse_config_invalid_multidoc():
+    """A CuminError is raised if a multi-document configuration has a document that is not a mapping."""
+    with pytest.raises(cumin.CuminError, match='multiple documents must be all mappings'):
+        cumin.parse_config(get_fixture_path(os.path.join('config', 'invalid_multidoc', 'config.yaml')))
+
+
+@pytest.mark.parametrize('content', (
+    b'---\nkey1: value1\n',  # Single document with the document marker
+    b'# Header comment\n---\nkey1: value1\n---\nkey2: value2\n',  # Multiple documents after a comment
+    b'\xef\xbb\xbf---\nkey1: value1\n---\nkey2: value2\n',  # Multiple documents after a UTF-8 BOM
+    b'key1: value1\n---\n---\nkey2: value2\n',  # Multiple documents with an empty one, without the first marker
+))
+def test_parse_config_multidoc(tmp_path, content):
+    """The documents of a multi-document configuration should be merged, whatever precedes the first marker."""
+    config_file = tmp_path / 'config.yaml'
+    config_file.write_bytes(content)
+    config = cumin.parse_config(str(config_file))
+    expected = {'key1': 'value1'}
+    if b'key2' in content:
+        expected['key2'] = 'value2'
+
+    assert config == expected
+
+
 def test_parse_config_empty():
     """An empty dictionary is returned if the configuration is empty."""
     config = cumin.parse_config(get_fixture_path(os.path.join('config', 'empty', 'config.yaml')))
@@ -132,6 +275,18 @@ def test_trace_logging_method_existing():
     assert hasattr(logging.Logger, 'trace')
 
 
+def test_trace_logging_already_installed():
+    """If both the trace method and its logging level are already installed, it should not touch logging at all."""
+    importlib.reload(logging)  # Avoid conflict given the singleton nature of this module
+    logging.addLevelName(cumin.LOGGING_TRACE_LEVEL_NUMBER, cumin.LOGGING_TRACE_LEVEL_NAME)
+    logging.Logger.trace = cumin.trace
+    with mock.patch('logging.addLevelName') as mocked_add_level_name:
+        importlib.reload(cumin)
+
+    assert not mocked_add_level_name.called
+    assert logging.getLevelName(cumin.LOGGING_TRACE_LEVEL_NAME) == cumin.LOGGING_TRACE_LEVEL_NUMBER
+
+
 def test_nodeset():
     """Calling nodeset() should return an instance of ClusterShell NodeSet with no resolver."""
     nodeset = cumin.nodeset('node[1-2]')
@@ -156,6 +311,13 @@ def test_nodeset_fromlist():
     assert nodeset._resolver is None  # pylint: disable=protected-access
 
 
+def test_nodeset_fromlist_generator():
+    """Calling nodeset_fromlist() with a generator should return an instance of ClusterShell NodeSet with its nodes."""
+    nodeset = cumin.nodeset_fromlist(f'node{i}' for i in range(1, 3))
+    assert nodeset == NodeSet('node[1-2]')
+    assert nodeset._resolver is None  # pylint: disable=protected-access
+
+
 def test_nodeset_fromlist_empty():
     """Calling nodeset_fromlist() with empty list should return an instance of ClusterShell NodeSet with no resolver."""
     nodeset = cumin.nodeset_fromlist([])
@@ -254,3 +416,71 @@ def test_ensure_kerberos_ticket_valid(mocked_geteuid, mocked_os_access, mocked_r
 
     mocked_os_access.assert_called_once_with(cumin.KERBEROS_KLIST, os.X_OK)
     mocked_run.assert_called_once_with(run_command, check=True)
+
+
+@mock.patch('cumin._KERBEROS_TICKET_CACHE', {'checked_at': 0.0, 'valid': False})
+@mock.patch('cumin.time.monotonic')
+@mock.patch('cumin.subprocess.run')
+@mock.patch('cumin.os.access')
+def test_ensure_kerberos_ticket_cache_ttl(mocked_os_access, mocked_run, mocked_monotonic):
+    """It should not check again the Kerberos ticket until the cache_ttl is expired."""
+    run_command = [cumin.KERBEROS_KLIST, '-s']
+    mocked_run.return_value = CompletedProcess(run_command, 0)
+    mocked_os_access.return_value = True
+    mocked_monotonic.side_effect = [100.0, 130.0, 200.0, 200.0]
+    config = {'kerberos': {'ensure_ticket': True, 'ensure_ticket_root': True, 'cache_ttl': 60}}
+
+    cumin.ensure_kerberos_ticket(config)  # Checked
+    cumin.ensure_kerberos_ticket(config)  # Cached
+    assert mocked_run.call_count == 1
+    cumin.ensure_kerberos_ticket(config)  # Expired, checked again
+    assert mocked_run.call_count == 2
+
+
+@mock.patch('cumin._KERBEROS_TICKET_CACHE', {'checked_at': 0.0, 'valid': False})
+@mock.patch('cumin.subprocess.run')
+@mock.patch('cumin.os.access')
+def test_ensure_kerberos_ticket_cache_ttl_invalid(mocked_os_access, mocked_run):
+    """It should not cache a failed check of the Kerberos ticket."""
+    run_command = [cumin.KERBEROS_KLIST, '-s']
+    mocked_run.side_effect = CalledProcessError(1, run_command)
+    mocked_os_access.return_value = True
+    config = {'kerberos': {'ensure_ticket': True, 'ensure_ticket_root': True, 'cache_ttl': 60}}
+
+    for _ in range(2):
+        with pytest.raises(cumin.CuminError, match='but no active Kerberos ticket was found'):
+            cumin.ensure_kerberos_ticket(config)
+
+    assert mocked_run.call_count == 2
+
+
+@pytest.mark.parametrize('prefix', ('', 'FILE:'))
+@mock.patch('cumin.subprocess.run')
+def test_ensure_kerberos_ticket_ccache_recent(mocked_run, prefix, monkeypatch, tmp_path):
+    """It should not run klist if the credential cache file was recently modified."""
+    ccache = tmp_path / 'krb5cc'
+    ccache.write_bytes(b'')
+    monkeypatch.setenv('KRB5CCNAME', prefix + str(ccache))
+    cumin.ensure_kerberos_ticket({'kerberos': {'ensure_ticket': True, 'ensure_ticket_root': True,
+                                               'ccache_max_age': 3600}})
+    assert not mocked_run.called
+
+
+@pytest.mark.parametrize('ccache_name', ('old', 'missing', 'KEYRING:persistent:1000'))
+@mock.patch('cumin.subprocess.run')
+@mock.patch('cumin.os.access')
+def test_ensure_kerberos_ticket_ccache_fallback(mocked_os_access, mocked_run, ccache_name, monkeypatch, tmp_path):
+    """It should run klist if the credential cache file is old, missing or not file-based."""
+    ccache = tmp_path / 'old'
+    ccache.write_bytes(b'')
+    os.utime(ccache, (0, 0))
+    if ccache_name in ('old', 'missing'):
+        ccache_name = str(tmp_path / ccache_name)
+
+    monkeypatch.setenv('KRB5CCNAME', ccache_name)
+    mocked_os_access.return_value = True
+    run_command = [cumin.KERBEROS_KLIST, '-s']
+    mocked_run.return_value = CompletedProcess(run_command, 0)
+    cumin.ensure_kerberos_ticket({'kerberos': {'ensure_ticket': True, 'ensure_ticket_root': True,
+                                               'ccache_max_age': 3600}})
+    mocked_run.assert_called_once_with(run_command, check=True)
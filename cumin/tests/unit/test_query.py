@@ -1,4 +1,7 @@
 """Query handling tests."""
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
 import pytest
 
 from cumin import backends, nodeset
@@ -125,3 +128,20 @@ def test_execute_complex_global():
     hosts = query.execute(
         '(D{(host1 or host2) and host[1-5]}) or ((D{host[100-150]} and not D{host1[20-30]}) and D{host1[01,15,30]})')
     assert hosts == nodeset('host[1-2,101,115]')
+
+
+@pytest.mark.parametrize('workers, parallel', ((None, False), (1, False), (4, True)))
+def test_execute_subquery_workers(workers, parallel):
+    """Executing a query with multiple subqueries should execute them in parallel only if configured."""
+    config = {}
+    if workers is not None:
+        config['subquery_workers'] = workers
+    query = Query(config)
+
+    with mock.patch('cumin.query.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as mocked_executor:
+        hosts = query.execute('(D{host[1-5]} and not D{host2}) or D{host10} xor D{host[4-5]}')
+
+    assert hosts == nodeset('host[1,3,10]')
+    assert mocked_executor.called is parallel
+    if parallel:
+        mocked_executor.assert_called_once_with(max_workers=4)